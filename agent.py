@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+"""
+  Local agent that keeps warm gateway connections, the response cache and the
+  account identity for every script of the user.
+
+    python3 agent.py [start|status|stop]
+
+  start runs the agent in the foreground (use nohup, tmux or a systemd user
+  unit to keep it running), status tells if one is running and stop asks it
+  to exit.  Clients connect to $XDG_RUNTIME_DIR/pw-agent.sock, or
+  <tmp>/pw-agent-<uid>.sock, or PW_AGENT_SOCKET when set, and go straight
+  to the gateway when no agent is listening.  PW_AGENT_IDLE makes the agent
+  exit after that many seconds without requests.
+"""
+
+import http.client
+import json
+import os
+import socket
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from cache import TTLCache
+
+# seconds the agent answers list calls from its cache, identity changes rarely
+AGENT_CACHE_TTL = {'identity': 3600, 'resources': 5, 'clusters': 5, 'storages': 60, 'workflows': 60}
+
+
+class AgentUnavailable(Exception):
+    pass
+
+
+def default_socket_path():
+    if os.environ.get('PW_AGENT_SOCKET'):
+        return os.environ['PW_AGENT_SOCKET']
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return os.path.join(os.environ['XDG_RUNTIME_DIR'], 'pw-agent.sock')
+    return os.path.join(tempfile.gettempdir(), 'pw-agent-%d.sock' % os.getuid())
+
+
+def _send(sock, header, body=b''):
+    header = json.dumps(header).encode()
+    sock.sendall(struct.pack('!II', len(header), len(body)) + header + body)
+
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1024 * 1024))
+        if not chunk:
+            raise ConnectionError('agent closed the connection')
+        data += chunk
+    return bytes(data)
+
+
+def _recv(sock):
+    header_size, body_size = struct.unpack('!II', _recv_exact(sock, 8))
+    return json.loads(_recv_exact(sock, header_size)), _recv_exact(sock, body_size)
+
+
+class AgentConnection():
+    """
+      The client side of the agent socket.  Each call opens its own
+      connection, which costs far less than the TLS handshake it saves and
+      keeps the connection safe to share between threads.
+    """
+
+    def __init__(self, path=None, timeout=300):
+        self.path = path if path is not None else default_socket_path()
+        self.timeout = timeout
+
+    @classmethod
+    def find(cls, path=None):
+        # a connection to the agent if its socket exists, None otherwise
+        connection = cls(path)
+        return connection if os.path.exists(connection.path) else None
+
+    def _call(self, header, body=b''):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            raise AgentUnavailable(str(e))
+        try:
+            _send(sock, header, body)
+            return _recv(sock)
+        except (OSError, ValueError, struct.error) as e:
+            # the request may have reached the gateway, do not send it again
+            raise requests.exceptions.ConnectionError('pw agent: %s' % e)
+        finally:
+            sock.close()
+
+    def request(self, client, method, url, idempotent=True, collection=None, max_age=None, **kwargs):
+        """
+          Send one gateway call through the agent and return a
+          requests.Response.  Raises AgentUnavailable when the agent cannot
+          be reached, nothing has been sent then.
+        """
+        data = kwargs.pop('data', None)
+        if isinstance(data, str):
+            data = data.encode()
+        header = {
+            'op': 'request',
+            'base': client.url,
+            'key': client.key,
+            'method': method,
+            'url': url,
+            'idempotent': idempotent,
+            'headers': kwargs.pop('headers', {}),
+            'params': kwargs.pop('params', None),
+            'json': kwargs.pop('json', None),
+            'collection': collection,
+            'max_age': max_age,
+        }
+        reply, body = self._call(header, data or b'')
+        if reply.get('error'):
+            raise requests.exceptions.ConnectionError('pw agent: ' + reply['error'])
+        response = requests.Response()
+        response.status_code = reply['status']
+        response.reason = http.client.responses.get(reply['status'], '')
+        response.headers = CaseInsensitiveDict(reply['headers'])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = reply['url']
+        response._content = body
+        return response
+
+    def invalidate(self, client, collection=None):
+        self._call({'op': 'invalidate', 'base': client.url, 'key': client.key, 'collection': collection})
+
+    def ping(self):
+        try:
+            return self._call({'op': 'ping'})[0]
+        except (AgentUnavailable, requests.exceptions.ConnectionError):
+            return None
+
+
+class AgentHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        server = self.server
+        server.last_request = time.monotonic()
+        if hasattr(socket, 'SO_PEERCRED'):
+            creds = self.request.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+            if struct.unpack('3i', creds)[1] != os.getuid():
+                return
+        try:
+            header, body = _recv(self.request)
+            _send(self.request, *server.dispatch(header, body))
+            if header.get('op') == 'stop':
+                # only once the reply is out, the process exits with the server
+                threading.Thread(target=server.shutdown, daemon=True).start()
+        except Exception as e:
+            try:
+                _send(self.request, {'error': str(e)})
+            except OSError:
+                pass
+
+
+class AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+      Serves gateway calls for any number of scripts.  One Client per
+      gateway and API key holds the pooled connections, retries, circuit
+      breaker and rate limits, and GETs of the list collections are answered
+      from a shared cache for AGENT_CACHE_TTL seconds unless the caller asks
+      for something fresher.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path=None, cache_ttl=None, cache_size=512, idle_timeout=None):
+        self.path = path if path is not None else default_socket_path()
+        self.cache_ttl = dict(AGENT_CACHE_TTL, **(cache_ttl or {}))
+        self.cache = TTLCache(cache_size)
+        self.idle_timeout = idle_timeout
+        self.clients = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.last_request = time.monotonic()
+        if os.path.exists(self.path):
+            if AgentConnection(self.path).ping() is not None:
+                raise RuntimeError('an agent is already listening on ' + self.path)
+            os.unlink(self.path)
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, self.path, AgentHandler)
+        finally:
+            os.umask(umask)
+
+    def client(self, base, key):
+        from client import Client
+        with self.lock:
+            client = self.clients.get((base, key))
+            if client is None:
+                client = Client(base, key, agent=False)
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32)
+                client.session.mount('https://', adapter)
+                client.session.mount('http://', adapter)
+                self.clients[(base, key)] = client
+            return client
+
+    def dispatch(self, header, body):
+        op = header.get('op')
+        if op == 'ping':
+            return {'pid': os.getpid(), 'started': self.started, 'accounts': len(self.clients)}, b''
+        if op == 'stop':
+            return {'stopping': True}, b''
+        client = self.client(header['base'], header['key'])
+        if op == 'invalidate':
+            # only the lists of this account on this gateway, other scripts keep theirs
+            self.cache.invalidate(header.get('collection'),
+                                  lambda key: key[1] == client.account and key[2].startswith(client.url))
+            return {'ok': True}, b''
+        collection = header.get('collection')
+        key = (collection, client.account, header['url'], json.dumps(header.get('params'), sort_keys=True))
+        ttl = self.cache_ttl.get(collection) if collection and header['method'] == 'GET' else None
+        max_age = header.get('max_age')
+        if ttl and max_age != 0:
+            entry = self.cache.get(key)
+            if entry is not None:
+                fetched, reply, content = entry
+                age = time.time() - fetched
+                if max_age is None or age <= max_age:
+                    reply = dict(reply, headers=dict(reply['headers'], Age=str(int(age))))
+                    return reply, content
+        kwargs = {'headers': header.get('headers') or {}}
+        if header.get('params') is not None:
+            kwargs['params'] = header['params']
+        if header.get('json') is not None:
+            kwargs['json'] = header['json']
+        if body:
+            kwargs['data'] = body
+        req = client._request(header['method'], header['url'], header.get('idempotent', True), **kwargs)
+        reply = {'status': req.status_code, 'headers': dict(req.headers), 'url': req.url}
+        # the body is sent decoded, drop the headers that describe the wire form
+        for name in ('Content-Encoding', 'Transfer-Encoding', 'Content-Length', 'Connection'):
+            reply['headers'].pop(name, None)
+        if ttl and req.status_code == 200:
+            self.cache.set(key, (time.time(), reply, req.content), ttl)
+        return reply, req.content
+
+    def service_actions(self):
+        if self.idle_timeout and time.monotonic() - self.last_request > self.idle_timeout:
+            threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'start'
+    connection = AgentConnection()
+    if command == 'status':
+        status = connection.ping()
+        if status is None:
+            print("No agent is running on", connection.path)
+            sys.exit(1)
+        print("Agent", status['pid'], "running on", connection.path, "for", status['accounts'], "account(s)")
+    elif command == 'stop':
+        try:
+            connection._call({'op': 'stop'})
+            print("Agent stopped")
+        except (AgentUnavailable, requests.exceptions.ConnectionError):
+            print("No agent is running on", connection.path)
+            sys.exit(1)
+    elif command == 'start':
+        idle = float(os.environ.get('PW_AGENT_IDLE', 0)) or None
+        try:
+            server = AgentServer(idle_timeout=idle)
+        except RuntimeError as e:
+            print(e)
+            sys.exit(1)
+        print("Agent listening on", server.path)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    else:
+        print("Usage: agent.py [start|status|stop]")
+        sys.exit(1)
@@ -0,0 +1,152 @@
+import aiohttp
+import base64
+from decoder import get_decoder
+
+
+class AsyncClient():
+    """
+      asyncio counterpart of client.Client.  Every method mirrors the blocking
+      client but is a coroutine, and all calls share one pooled aiohttp
+      session so a single event loop can keep many gateway requests in flight.
+
+        async with AsyncClient(pw_url, api_key) as c:
+            clusters = await c.get_v3_clusters()
+    """
+
+    def __init__(self, url, key, max_connections=100, timeout=60, decoder=None):
+        self.url = url
+        self.api = url+'/api'
+        self.key = key
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.session = None
+        self.decode = get_decoder(decoder)
+        self.headers = {
+            'Content-Type': 'application/json',
+            'Authorization': 'Basic ' + base64.b64encode(bytes(self.key, 'utf-8')).decode('utf-8')
+        }
+
+    async def __aenter__(self):
+        self._session()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _session(self):
+        # the session has to be created inside a running event loop
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def _request(self, method, url, **kwargs):
+        async with self._session().request(method, url, **kwargs) as req:
+            req.raise_for_status()
+            return await req.text()
+
+    async def _request_json(self, method, url, **kwargs):
+        async with self._session().request(method, url, **kwargs) as req:
+            req.raise_for_status()
+            return self.decode(await req.read())
+
+    async def get_resources(self):
+        return await self._request_json('GET', self.api + "/resources")
+
+    async def get_resource(self, name):
+        data = await self._request_json('GET', self.api + "/resources")
+
+        resource = [x for x in data if x['name'].lower() == name.lower()]
+
+        return resource
+
+    async def get_v3_clusters(self):
+        return await self._request_json('GET', self.api + "/compute/clusters/")
+
+    async def get_v3_cluster(self, namespace, cluster):
+        return await self._request_json('GET', self.api + "/compute/clusters/" + namespace + "/" + cluster)
+
+    async def delete_resource(self, id: str):
+        return await self._request('DELETE', self.api + "/v2/resources/{}".format(id))
+
+    async def create_v2_cluster(self, name: str, description: str, tags: str, type: str):
+        if type != 'pclusterv2' and type != 'gclusterv2' and type != 'azclusterv2':
+            raise Exception("Invalid cluster type")
+        url = self.api + "/v2/resources"
+        payload = {
+            'name': name,
+            'description': description,
+            'tags': tags,
+            'type': type,
+            'params': {
+                "jobsPerNode": ""
+            }
+        }
+        return await self._request_json('POST', url, data=payload)
+
+    async def update_v2_cluster(self, id: str, cluster_definition):
+        if id is None or id == "":
+            raise Exception("Invalid cluster id")
+        url = self.api + "/v2/resources/{}".format(id)
+        return await self._request_json('PUT', url, json=cluster_definition)
+
+    async def create_v3_cluster(self, clusterDef):
+        url = self.api + "/compute/clusters/"
+        return await self._request('POST', url, json=clusterDef)
+
+    async def update_v3_cluster(self, clusterDef, namespace, clusterName):
+        url = self.api + "/compute/clusters/" + namespace + "/" + clusterName
+        return await self._request('PATCH', url, json=clusterDef)
+
+    async def start_resource(self, id: str):
+        return await self._request('GET', self.api + "/resources/start", params={'id': id})
+
+    async def start_v3_cluster(self, namespace, clusterName):
+        return await self._request('POST', self.api + "/compute/clusters/" + namespace + "/" + clusterName + "/sessions")
+
+    async def stop_resource(self, id):
+        return await self._request('GET', self.api + "/resources/stop", params={'id': id})
+
+    async def stop_v3_cluster(self, namespace, clusterName):
+        return await self._request('DELETE', self.api + "/compute/clusters/" + namespace + "/" + clusterName + "/sessions")
+
+    async def get_identity(self):
+        return await self._request_json('GET', self.api + "/v2/auth/session")
+
+    async def get_workflows(self):
+        return await self._request_json('GET', self.api + "/v2/workflows")
+
+    async def run_workflow(self, name, inputs):
+        url = self.api + "/v2/workflows/" + name + "/start"
+        payload = {
+            'variables': inputs
+        }
+        return await self._request_json('POST', url, json=payload)
+
+    async def get_latest_job_status(self, workflow_name):
+        return await self.get_job_status(workflow_name, 0)
+
+    async def get_job_status(self, workflow_name, jid):
+        return await self._request_json('GET', self.api + "/v2/workflows/" + workflow_name + "/jobs/" + str(jid))
+
+    async def get_workflow_jobs(self, workflow_name):
+        return await self._request_json('GET', self.api + "/v2/workflows/" + workflow_name + "/jobs")
+
+    async def get_storages(self):
+        return await self._request_json('GET', self.api + "/storage")
+
+    async def get_bucket_cred(self, id: str):
+        url = self.api + "/v2/vault/getBucketToken"
+        payload = {
+            'bucketID': id
+        }
+        return await self._request_json('POST', url, json=payload)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+"""
+  Compares the old response handling, json.loads(req.text), with the decoder
+  layer used by Client on a large synthetic /compute/clusters/ payload.
+
+    python3 benchmarks/decodeBenchmark.py [number_of_clusters]
+
+  req.text first builds a str copy of the whole body before parsing it.  The
+  decoder layer hands the bytes to the backend: orjson parses them without
+  the intermediate str, the standard library still decodes internally so it
+  only serves as the fallback.  Peak memory is measured with tracemalloc,
+  which only sees allocations made through the Python allocator.
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from decoder import DECODERS
+
+
+def synthetic_clusters(count):
+    clusters = []
+    for i in range(count):
+        clusters.append({
+            'id': '%024x' % i,
+            'name': 'cluster%d' % i,
+            'displayName': 'Cluster %d' % i,
+            'namespace': 'user%d' % (i % 50),
+            'type': 'aws-slurm',
+            'status': 'on' if i % 3 else 'off',
+            'currentSessionStatus': 'running' if i % 3 else 'off',
+            'controllerIp': '10.0.%d.%d' % (i // 256 % 256, i % 256),
+            'tags': 'tag1,tag2',
+            'variables': {
+                'region': 'us-east-1',
+                'zone': 'us-east-1a',
+                'controller': {'instanceType': 'c5.2xlarge', 'image': 'ami-%08x' % i, 'diskSize': 250},
+                'partitions': [
+                    {'name': 'compute%d' % p, 'instanceType': 'c5n.18xlarge', 'maxNodes': 100,
+                     'spot': bool(p % 2), 'description': 'partition description ' * 4}
+                    for p in range(4)
+                ],
+                'attachedStorages': [{'id': '%024x' % (i + s), 'mountPoint': '/mnt/s%d' % s} for s in range(2)],
+                'bootstrap': '#!/bin/bash\n' + 'echo configuring node\n' * 20,
+            },
+        })
+    return clusters
+
+
+def measure(label, fn, body, repeat):
+    # one traced run for the peak, untraced runs for the time
+    tracemalloc.start()
+    fn(body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(body)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    print('%-28s %10.1f ms %10.1f MB peak' % (label, elapsed * 1000, peak / 1e6))
+    return elapsed, peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeat = 5
+    body = json.dumps(synthetic_clusters(count)).encode('utf-8')
+    print('Synthetic cluster list: %d clusters, %.1f MB body\n' % (count, len(body) / 1e6))
+
+    baseline = measure('json.loads(body.decode())', lambda b: json.loads(b.decode('utf-8')), body, repeat)
+    for name, loads in DECODERS.items():
+        elapsed, peak = measure('decoder ' + name + ' (bytes)', loads, body, repeat)
+        print('%-28s %10.2fx time %9.2fx peak' % ('', baseline[0] / elapsed, baseline[1] / max(peak, 1)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+"""
+  Compares how long the old per-script startup took with the pw.py command.
+
+    python3 benchmarks/startupBenchmark.py [runs] [latency_seconds]
+
+  Imports: the wall time of a fresh interpreter importing what every old
+  script imported at the top (subprocess, json, requests and client)
+  against importing pw, which only loads the standard library until a
+  command runs, and against running "pw.py --help".
+
+  Operations: three stop commands for a cluster that is already off, run
+  against a local stand-in gateway that answers every call after
+  latency_seconds.  The old scripts each started a process, built a client
+  and called get_identity and the resources list before doing anything.
+  pw.py chains the three with "+" in one process, answers the identity
+  from the metadata store and only fetches the list.  The process startup
+  cost is the old import time, once for pw.py and once per script before.
+"""
+
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+
+def time_command(args, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(args, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def gateway(latency):
+    # answers identity and the resources list after latency seconds
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            time.sleep(latency)
+            if self.path.startswith('/api/v2/auth/session'):
+                body = {'username': 'bench'}
+            elif self.path.startswith('/api/resources'):
+                body = [{'name': 'c1', 'id': '1', 'status': 'off', 'state': {}}]
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:%d' % server.server_port
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    python = sys.executable
+
+    print("Imports, median of %d fresh interpreters" % runs)
+    empty = time_command([python, '-c', 'pass'], runs)
+    old = time_command([python, '-c', 'import subprocess, json, requests; import client'], runs)
+    new = time_command([python, '-c', 'import pw'], runs)
+    helped = time_command([python, 'pw.py', '--help'], runs)
+    print("  %-38s %7.1f ms" % ('python -c pass', empty * 1000))
+    print("  %-38s %7.1f ms" % ('old script imports', old * 1000))
+    print("  %-38s %7.1f ms" % ('import pw', new * 1000))
+    print("  %-38s %7.1f ms" % ('pw.py --help', helped * 1000))
+
+    from client import Client
+    from store import MetadataStore
+    import pw
+
+    server, url = gateway(latency)
+    ops = 3
+    print("\nThree stop commands, %.0f ms per gateway call" % (latency * 1000))
+
+    start = time.perf_counter()
+    for _ in range(ops):
+        c = Client(url, 'bench', breaker=None, agent=False)
+        c.get_identity()
+        c.get_resource_index().get('c1')
+    legacy = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # a store that has seen the identity once, as after any earlier run
+        store = MetadataStore(os.path.join(tmp, 'metadata.sqlite'))
+        Client(url, 'bench', breaker=None, agent=False, store=store).get_identity()
+        start = time.perf_counter()
+        ctx = pw.Context({'HOME': tmp})
+        ctx._client = Client(url, 'bench', breaker=None, agent=False, store=store)
+        with contextlib.redirect_stdout(io.StringIO()):
+            code = pw.main(['stop', 'c1', '+', 'stop', 'c1', '+', 'stop', 'c1'], ctx)
+        chained = time.perf_counter() - start
+        store.close()
+    server.shutdown()
+    assert code == 0
+
+    print("  %-38s %7.1f ms" % ('old scripts, calls only', legacy * 1000))
+    print("  %-38s %7.1f ms" % ('old scripts, with process startup', (legacy + ops * old) * 1000))
+    print("  %-38s %7.1f ms" % ('pw.py stop + stop + stop', chained * 1000))
+    print("  %-38s %7.1f ms" % ('pw.py, with process startup', (chained + old) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+"""
+  This script prints short-term credentials for one bucket and nothing else,
+  so cloud CLIs and SDKs can call it directly, e.g. in ~/.aws/config:
+
+    [profile pw-bucket]
+    credential_process = /path/to/bucketCredentialProcess.py <bucket>
+
+  <bucket> is a bucket id, or namespace/name to look the bucket up.  S3
+  bucket tokens are printed in the AWS credential_process format, tokens of
+  other providers as returned by the platform.
+
+  Tokens are cached in $HOME/.cache/pw/credentials (or PW_CREDENTIAL_CACHE)
+  and shared by every process, so the platform is only asked for a new one
+  shortly before the cached one expires.
+
+  Critical files that must exist:
+
+    $HOME/.ssh/pw_api.key - this file must contain the API key in the first and only
+                            line.  Treat this file as any secure file and place in
+                            .ssh directory.  Change permissions to mode 600.
+
+  Same as: python3 pw.py credential-process <arguments>, see pw.py.
+"""
+
+import sys
+from pw import main
+
+sys.exit(main(['credential-process'] + sys.argv[1:]))
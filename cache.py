@@ -0,0 +1,48 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache():
+    """
+      Size bounded least-recently-used cache whose entries also expire after
+      a per-entry time to live.  Keys are (collection, url) tuples so that a
+      whole collection can be invalidated at once after a write.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, collection=None, match=None):
+        # match narrows the invalidation to the keys it returns True for
+        with self.lock:
+            if collection is None and match is None:
+                self.entries.clear()
+                return
+            for key in [key for key in self.entries
+                        if (collection is None or key[0] == collection) and (match is None or match(key))]:
+                del self.entries[key]
@@ -1,53 +1,337 @@
 import requests
-import json
 import pprint as pp
 import base64
+import os
+import threading
+import time
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from cache import TTLCache
+from index import ClusterIndex
+from decoder import get_decoder, iter_json_array
+from retry import RetryPolicy, retry_after_seconds, shared_breaker
+from ratelimit import RateLimiter, endpoint_class
+from poller import PollScheduler
+from watch import diff_records
+from transfer import download_file, upload_file
+from store import MetadataStore, account_fingerprint
+from agent import AgentConnection, AgentUnavailable
+
+
+# collections whose list responses may be cached
+CACHED_COLLECTIONS = ('identity', 'resources', 'clusters', 'storages', 'workflows')
 
 
 class Client():
 
-    def __init__(self, url, key):
+    def __init__(self, url, key, cache_ttl=None, cache_size=128, decoder=None,
+                 retry=True, breaker=True, rate_limit=None, store=None, agent=None):
+        """
+          cache_ttl turns on the response cache for the list endpoints.  It is
+          either a number of seconds for every collection or a dict keyed by
+          collection ('identity', 'resources', 'clusters', 'storages',
+          'workflows').
+
+          decoder picks the JSON backend used on response bodies, see
+          decoder.get_decoder.  By default orjson is used when installed.
+
+          retry is a retry.RetryPolicy for transient gateway errors and breaker
+          a retry.CircuitBreaker.  True uses the defaults, where the breaker is
+          shared by every client of the same gateway, and None turns them off.
+
+          rate_limit throttles calls per endpoint class ('list', 'mutate',
+          'vault') with token buckets shared by every process using the same
+          API key.  It is a ratelimit.RateLimiter, a dict or string of limits
+          for one, or None to read the limits from PW_RATE_LIMIT if set, e.g.
+          PW_RATE_LIMIT="list=10,mutate=2:5,vault=1".
+
+          store keeps the same collections in a store.MetadataStore shared by
+          every process on the machine and answers from it at once, refreshing
+          old entries in the background.  It is a MetadataStore, True for one
+          at the default path, or None.  Every list method takes fresh: True
+          always asks the gateway, a number of seconds accepts data at most
+          that old, use it when the answer decides what to change.
+
+          agent sends the gateway calls through the local agent (agent.py),
+          which keeps warm connections and a cache shared by every script.
+          None uses the agent when its socket exists, a path uses the agent
+          listening there and False never does.  Calls through the agent get
+          the agent's retries, breaker and rate limits, so None does not use
+          it when retry, breaker or rate_limit are passed explicitly.
+          Streaming calls always go straight to the gateway, and so does
+          everything once the agent cannot be reached.
+        """
         self.url = url
         self.api = url+'/api'
         self.key = key
         self.session = requests.Session()
+        self.decode = get_decoder(decoder)
         self.headers = {
             'Content-Type': 'application/json',
             'Authorization': 'Basic ' + base64.b64encode(bytes(self.key, 'utf-8')).decode('utf-8')
         }
+        self.cache = None
+        self.cache_ttl = {}
+        if cache_ttl is not None:
+            if isinstance(cache_ttl, dict):
+                self.cache_ttl = dict(cache_ttl)
+            else:
+                self.cache_ttl = {collection: cache_ttl for collection in CACHED_COLLECTIONS}
+            self.cache = TTLCache(cache_size)
+        self.indexes = {}
+        self.retry = RetryPolicy() if retry is True else retry
+        self.breaker = shared_breaker(url) if breaker is True else breaker
+        from_env = rate_limit is None
+        if rate_limit is None:
+            rate_limit = os.environ.get('PW_RATE_LIMIT') or None
+        if isinstance(rate_limit, str):
+            rate_limit = RateLimiter.from_string(rate_limit, shared_key=url + key)
+        elif isinstance(rate_limit, dict):
+            rate_limit = RateLimiter(rate_limit, shared_key=url + key)
+        self.rate_limit = rate_limit
+        self.store = MetadataStore() if store is True else store
+        self.host = urlparse(url).netloc
+        self.account = account_fingerprint(key)
+        self.revalidating = {}
+        own_limits = retry is not True or breaker is not True or (rate_limit is not None and not from_env)
+        if agent is None and own_limits:
+            # the caller wants its own limits, which the agent would not apply
+            agent = False
+        if agent is None or isinstance(agent, str):
+            agent = AgentConnection.find(agent)
+        self.agent = agent or None
+        self.lock = threading.Lock()
 
-    def get_resources(self):
-        req = self.session.get(self.api + "/resources", headers = self.headers)
+    def _request(self, method, url, idempotent=True, collection=None, max_age=None, **kwargs):
+        # every gateway call goes through here for retries and the circuit breaker
+        if self.agent is not None and not kwargs.get('stream') and not isinstance(kwargs.get('data'), dict):
+            try:
+                return self.agent.request(self, method, url, idempotent, collection, max_age, **kwargs)
+            except AgentUnavailable:
+                # the agent is not running, talk to the gateway directly from now on
+                self.agent = None
+        headers = dict(self.headers, **kwargs.pop('headers', {}))
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.wait(self.retry.max_retry_after if self.retry is not None else 0)
+            if self.rate_limit is not None:
+                self.rate_limit.acquire(endpoint_class(method, url))
+            try:
+                req = self.session.request(method, url, headers = headers, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                if self.retry is None or not self.retry.should_retry(attempt, idempotent, error=e):
+                    raise
+                time.sleep(self.retry.delay(attempt))
+                attempt += 1
+                continue
+            if self.breaker is not None:
+                if req.status_code == 429 or req.status_code >= 500:
+                    self.breaker.record_failure(retry_after_seconds(req))
+                else:
+                    self.breaker.record_success()
+            if self.retry is None or not self.retry.should_retry(attempt, idempotent, status=req.status_code):
+                return req
+            delay = self.retry.delay(attempt, req)
+            req.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _fetch(self, collection, url, max_age=None):
+        req = self._request('GET', url, collection=collection, max_age=max_age)
         req.raise_for_status()
-        data = json.loads(req.text)
+        data = self.decode(req.content)
+        # an answer from the agent's cache says how old it is
+        fetched = time.time() - float(req.headers.get('Age') or 0)
+        ttl = self.cache_ttl.get(collection) if self.cache is not None else None
+        if ttl:
+            self.cache.set((collection, url), (fetched, data), ttl)
+        if self.store is not None:
+            self.store.set(self.host, self.account, url, collection, req.content, fetched)
         return data
 
-    def get_resource(self, name):
-        req = self.session.get(self.api + "/resources", headers = self.headers)
-        req.raise_for_status()
-        data = json.loads(req.text)
-        
-        resource = [x for x in data if x['name'].lower() == name.lower()]
+    def _revalidate(self, collection, url):
 
-        return resource
+        def run():
+            try:
+                self._fetch(collection, url)
+            except Exception:
+                # the stored answer stays until the next call tries again
+                pass
+            finally:
+                with self.lock:
+                    self.revalidating.pop(url, None)
 
-    def get_v3_clusters(self):
-        req = self.session.get(self.api + "/compute/clusters/", headers = self.headers)
-        req.raise_for_status()
-        data = json.loads(req.text)
-        return data
+        with self.lock:
+            if url in self.revalidating:
+                return
+            thread = threading.Thread(target=run, daemon=True)
+            self.revalidating[url] = thread
+        thread.start()
 
-    def get_v3_cluster(self, namespace, cluster):
-        req = self.session.get(self.api + "/compute/clusters/" + namespace + "/" + cluster, headers = self.headers)
-        req.raise_for_status()
-        data = json.loads(req.text)
+    def wait_revalidated(self, timeout=None):
+        """
+          Wait for the background refreshes of the store to finish, they are
+          daemon threads and die with a script that exits right away.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self.lock:
+            threads = list(self.revalidating.values())
+        for thread in threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+
+    def _max_age(self, fresh):
+        if fresh is True:
+            return 0
+        return None if fresh is False or fresh is None else fresh
+
+    def _lookup(self, collection, url, fresh=False):
+        # fresh=False takes any cached answer, True none, a number one at most that many seconds old
+        max_age = self._max_age(fresh)
+        if max_age == 0:
+            return None
+        ttl = self.cache_ttl.get(collection) if self.cache is not None else None
+        if ttl:
+            entry = self.cache.get((collection, url))
+            if entry is not None and (max_age is None or time.time() - entry[0] <= max_age):
+                return entry[1]
+        if self.store is not None:
+            entry = self.store.get(self.host, self.account, url)
+            if entry is not None:
+                age = time.time() - entry[0]
+                if max_age is None and age <= self.store.max_stale or max_age is not None and age <= max_age:
+                    data = self.decode(entry[1])
+                    if ttl:
+                        self.cache.set((collection, url), (entry[0], data), ttl)
+                    if age > self.store.max_age:
+                        self._revalidate(collection, url)
+                    return data
+        return None
+
+    def _get_cached(self, collection, url, fresh=False):
+        data = self._lookup(collection, url, fresh)
+        if data is None:
+            data = self._fetch(collection, url, self._max_age(fresh))
         return data
 
+    def _iter_cached(self, collection, url, page_size=None, fresh=False):
+        # a cached list is already in memory, iterate over it instead of fetching
+        data = self._lookup(collection, url, fresh)
+        if data is not None:
+            yield from data
+            return
+        if page_size:
+            offset = 0
+            first = None
+            while True:
+                req = self._request('GET', url, params = {'limit': page_size, 'offset': offset})
+                req.raise_for_status()
+                page = self.decode(req.content)
+                # a gateway without paging ignores the parameters and keeps
+                # returning the whole list, stop instead of repeating it
+                if not page or page[0] == first:
+                    return
+                yield from page
+                if len(page) != page_size:
+                    return
+                first = page[0]
+                offset += page_size
+        else:
+            req = self._request('GET', url, stream = True)
+            try:
+                req.raise_for_status()
+                yield from iter_json_array(req.iter_content(chunk_size = 64 * 1024))
+            finally:
+                req.close()
+
+    def invalidate(self, collection=None):
+        if self.cache is not None:
+            self.cache.invalidate(collection)
+        if self.store is not None:
+            self.store.invalidate(self.host, self.account, collection)
+        if self.agent is not None:
+            try:
+                self.agent.invalidate(self, collection)
+            except (AgentUnavailable, requests.exceptions.ConnectionError):
+                self.agent = None
+
+    def _index(self, collection, data):
+        # reuse the index as long as the list comes back from the cache unchanged
+        indexed = self.indexes.get(collection)
+        if indexed is not None and indexed[0] is data:
+            return indexed[1]
+        index = ClusterIndex(data)
+        self.indexes[collection] = (data, index)
+        return index
+
+    def get_resources(self, fresh=False):
+        return self._get_cached('resources', self.api + "/resources", fresh)
+
+    def iter_resources(self, page_size=None, fresh=False):
+        """
+          Yield resources one at a time.  With page_size the list is fetched
+          page by page through limit/offset, otherwise the response is parsed
+          incrementally as it streams in.  Stop iterating to stop the download.
+        """
+        return self._iter_cached('resources', self.api + "/resources", page_size, fresh)
+
+    def get_resource_index(self, fresh=False):
+        return self._index('resources', self.get_resources(fresh))
+
+    def get_resource(self, name, fresh=False):
+        return self.get_resource_index(fresh).find(name)
+
+    def get_v3_clusters(self, fresh=False):
+        return self._get_cached('clusters', self.api + "/compute/clusters/", fresh)
+
+    def iter_v3_clusters(self, page_size=None, fresh=False):
+        """
+          Yield v3 clusters one at a time, see iter_resources.
+        """
+        return self._iter_cached('clusters', self.api + "/compute/clusters/", page_size, fresh)
+
+    def get_v3_cluster_index(self, fresh=False):
+        return self._index('clusters', self.get_v3_clusters(fresh))
+
+    def find_v3_cluster(self, namespace, cluster, fresh=False):
+        return self.get_v3_cluster_index(fresh).get(cluster, namespace)
+
+    def get_v3_cluster(self, namespace, cluster, fresh=False):
+        return self._get_cached('clusters', self.api + "/compute/clusters/" + namespace + "/" + cluster, fresh)
+
+    def watch_clusters(self, v2=False, v3=True, interval=5.0, max_interval=30.0, initial=True, include_updates=False):
+        """
+          Poll the v2 resources and/or v3 clusters lists and yield a
+          watch.ClusterEvent for every change: created, status,
+          session_status, controller_ip and deleted (and updated for any
+          other change with include_updates).  Records are fingerprinted so
+          only the ones that changed are compared.  Polling backs off towards
+          max_interval while nothing changes.  With initial=False the
+          clusters that exist at the first poll are not reported as created.
+        """
+        scheduler = PollScheduler(interval=interval, fast_interval=interval, max_interval=max_interval)
+        scheduler.add('watch')
+        snapshots = {}
+        first = True
+        while True:
+            scheduler.wait()
+            changed = False
+            for is_v3, fetch in ((False, self.get_resources if v2 else None), (True, self.get_v3_clusters if v3 else None)):
+                if fetch is None:
+                    continue
+                events, snapshots[is_v3] = diff_records(snapshots.get(is_v3, {}), fetch(fresh=True), is_v3, include_updates)
+                if first and not initial:
+                    continue
+                changed = changed or bool(events)
+                yield from events
+            first = False
+            scheduler.observe('watch', changed=changed)
+
     def delete_resource(self, id: str):
-        req = self.session.delete(
-            self.api + "/v2/resources/{}".format(id),
-            headers = self.headers
-        )
+        req = self._request('DELETE', self.api + "/v2/resources/{}".format(id))
+        self.invalidate('resources')
         req.raise_for_status()
         return req.text
 
@@ -65,108 +349,247 @@ class Client():
             }
         }
 
-        req = self.session.post(url, data=(payload), headers = self.headers)
+        req = self._request('POST', url, idempotent=False, data=(payload))
+        self.invalidate('resources')
         req.raise_for_status()
-        data = json.loads(req.text)
+        data = self.decode(req.content)
         return data
 
     def update_v2_cluster(self, id: str, cluster_definition):
         if id is None or id == "":
             raise Exception("Invalid cluster id")
         url = self.api + "/v2/resources/{}".format(id)
-        req = self.session.put(url, json = cluster_definition, headers = self.headers)
+        req = self._request('PUT', url, json = cluster_definition)
+        self.invalidate('resources')
         req.raise_for_status()
-        data = json.loads(req.text)
+        data = self.decode(req.content)
         return data
 
     def create_v3_cluster(self, clusterDef):
         url = self.api + "/compute/clusters/"
-        req = self.session.post(url, json = clusterDef, headers = self.headers)
+        req = self._request('POST', url, idempotent=False, json = clusterDef)
+        self.invalidate('clusters')
         req.raise_for_status()
         return req.text
         
     def update_v3_cluster(self, clusterDef, namespace, clusterName):
         url = self.api + "/compute/clusters/" + namespace + "/" + clusterName
-        req = self.session.patch(url, json = clusterDef, headers = self.headers)
+        req = self._request('PATCH', url, json = clusterDef)
+        self.invalidate('clusters')
         req.raise_for_status() 
         return req.text
 
     def start_resource(self, id: str):
-        req = self.session.get(
-            self.api + "/resources/start",
-            params = {'id': id},
-            headers = self.headers
-        )
+        req = self._request('GET', self.api + "/resources/start", params = {'id': id})
+        self.invalidate('resources')
         req.raise_for_status()
         return req.text
 
     def start_v3_cluster(self, namespace, clusterName):
-        req = self.session.post(
+        req = self._request(
+            'POST',
             self.api + "/compute/clusters/" + namespace + "/" + clusterName + "/sessions",
-            headers = self.headers
+            idempotent=False
         )
+        self.invalidate('clusters')
         req.raise_for_status()
         return req.text
 
     def stop_resource(self, id):
-        req = self.session.get(
-            self.api + "/resources/stop",
-            params = {'id': id},
-            headers = self.headers   
-        )
+        req = self._request('GET', self.api + "/resources/stop", params = {'id': id})
+        self.invalidate('resources')
         req.raise_for_status()
         return req.text
 
     def stop_v3_cluster(self, namespace, clusterName):
-        req = self.session.delete(
-            self.api + "/compute/clusters/" + namespace + "/" + clusterName + "/sessions",
-            headers = self.headers
-        )
+        req = self._request('DELETE', self.api + "/compute/clusters/" + namespace + "/" + clusterName + "/sessions")
+        self.invalidate('clusters')
         req.raise_for_status()
         return req.text
 
-    def get_identity(self):
-        url = self.api + "/v2/auth/session"
-        req = self.session.get(url, headers = self.headers)
-        req.raise_for_status()
-        data = json.loads(req.text)
-        return data
+    def _fan_out(self, fn, targets, max_workers):
+        # run fn on every target in parallel, collecting results and errors per target
+        results = {}
+        errors = {}
+        if not targets:
+            return results, errors
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(targets)))) as pool:
+            futures = {pool.submit(fn, target): target for target in targets}
+            for future, target in futures.items():
+                try:
+                    results[target] = future.result()
+                except Exception as e:
+                    errors[target] = e
+        return results, errors
+
+    def _start_one(self, target):
+        if isinstance(target, tuple):
+            return self.start_v3_cluster(*target)
+        return self.start_resource(target)
+
+    def _stop_one(self, target):
+        if isinstance(target, tuple):
+            return self.stop_v3_cluster(*target)
+        return self.stop_resource(target)
+
+    def start_many(self, targets, max_workers=8):
+        """
+          Start many clusters concurrently.  Each target is either a v2 resource
+          id or a (namespace, name) tuple for a v3 cluster.  Returns a
+          (results, errors) pair of dicts keyed by target.
+        """
+        return self._fan_out(self._start_one, targets, max_workers)
+
+    def stop_many(self, targets, max_workers=8):
+        """
+          Stop many clusters concurrently, see start_many.
+        """
+        return self._fan_out(self._stop_one, targets, max_workers)
+
+    def get_identity(self, fresh=False):
+        return self._get_cached('identity', self.api + "/v2/auth/session", fresh)
         
-    def get_workflows(self):
-        req = self.session.get(self.api + "/v2/workflows", headers = self.headers)
-        req.raise_for_status()
-        data = json.loads(req.text)
-        return data
+    def get_workflows(self, fresh=False):
+        return self._get_cached('workflows', self.api + "/v2/workflows", fresh)
 
     def run_workflow(self, name, inputs):
         url = self.api + "/v2/workflows/" + name + "/start"
         payload = {
             'variables': inputs
         }
-        req = self.session.post(url, json=payload,  headers = self.headers)
+        req = self._request('POST', url, idempotent=False, json=payload)
         req.raise_for_status()
-        data = json.loads(req.text)
+        data = self.decode(req.content)
         return data
 
     def get_latest_job_status(self, workflow_name):
-        url = self.api + "/v2/workflows/" + workflow_name + "/jobs/0"
-        req = self.session.get(url, headers = self.headers)
+        return self.get_job_status(workflow_name, 0)
+
+    def get_job_status(self, workflow_name, jid):
+        url = self.api + "/v2/workflows/" + workflow_name + "/jobs/" + str(jid)
+        req = self._request('GET', url)
         req.raise_for_status()
-        data = json.loads(req.text)
+        data = self.decode(req.content)
         return data
 
-    def get_storages(self):
-        req = self.session.get(self.api + "/storage",  headers = self.headers)
+    def get_workflow_jobs(self, workflow_name):
+        # one call for the state of every job of a workflow, see jobs.JobTracker
+        url = self.api + "/v2/workflows/" + workflow_name + "/jobs"
+        req = self._request('GET', url)
         req.raise_for_status()
-        data = json.loads(req.text)
+        data = self.decode(req.content)
         return data
 
+    def file_url(self, path):
+        # files under /pw (storage, job directories) are served by the platform at the same path
+        return self.url + path
+
+    def open_file(self, path, offset=0, end=None):
+        """
+          Open a platform file for streaming from byte offset (up to and
+          including byte end).  Returns (req, start, total): the open
+          streaming response, or None when there are no bytes at offset, the
+          offset the body starts at (0 when the server ignored the range) and
+          the file size when the server reports it.  The caller must close req.
+        """
+        headers = {}
+        if offset or end is not None:
+            headers['Range'] = 'bytes=%d-%s' % (offset, end if end is not None else '')
+        req = self._request('GET', self.file_url(path), headers = headers, stream = True)
+        total = None
+        content_range = req.headers.get('Content-Range', '')
+        if '/' in content_range and content_range.rsplit('/', 1)[1].isdigit():
+            total = int(content_range.rsplit('/', 1)[1])
+        if req.status_code == 416:
+            req.close()
+            return None, offset, total
+        req.raise_for_status()
+        if req.status_code == 206:
+            start = int(content_range.split()[1].split('-')[0])
+        else:
+            start = 0
+            if req.headers.get('Content-Length', '').isdigit():
+                total = int(req.headers['Content-Length'])
+        return req, start, total
+
+    def get_job_tail(self, jid, file, offset=0):
+        """
+          Return (data, offset) with the bytes of a job file from offset on
+          and the offset to pass on the next call.  Use tail.LogTail to
+          append large logs to disk instead of holding them in memory.
+        """
+        path = "/pw/jobs/{}/{}".format(jid, file)
+        req, start, total = self.open_file(path, offset)
+        if total is not None and total < offset:
+            # the file was truncated or rotated, start over
+            if req is not None:
+                req.close()
+            return self.get_job_tail(jid, file, 0)
+        if req is None:
+            return b'', offset
+        try:
+            data = req.content[offset - start:]
+        finally:
+            req.close()
+        return data, offset + len(data)
+
+    def tail_files(self, tails, max_workers=8):
+        """
+          Poll many tail.LogTail objects at once.  Returns a (results,
+          errors) pair of dicts keyed by tail, results hold the number of new
+          bytes written.
+        """
+        return self._fan_out(lambda tail: tail.poll(self), tails, max_workers)
+
+    def upload_dataset(self, filename, path, chunk_size=8 * 1024 * 1024, max_workers=4, compress=False):
+        """
+          Upload a local file into the platform directory path, see
+          transfer.upload_file.  An interrupted upload resumes from the
+          chunks already confirmed when called again.  The server has to
+          take ranged PUTs on the file path, otherwise
+          transfer.UploadNotSupported is raised.
+        """
+        remote_path = path.rstrip('/') + '/' + os.path.basename(filename)
+        return upload_file(self, filename, remote_path, chunk_size, max_workers, compress)
+
+    def download_dataset(self, path, local_path=None, parallel=4, part_size=16 * 1024 * 1024, sha256=None):
+        """
+          Stream a platform file straight to local_path (by default its name
+          in the current directory) and return a dict describing it, see
+          transfer.download_file.
+        """
+        if local_path is None:
+            local_path = os.path.basename(path)
+        return download_file(self, path, local_path, parallel, part_size, sha256)
+
+    def download_many(self, manifest, max_workers=8, verify_zip=False):
+        """
+          Download many files at once.  manifest holds (path, local_path)
+          pairs or dicts with 'path', 'local_path' and optional 'sha256'.
+          Returns a (results, errors) pair of dicts keyed by platform path.
+        """
+        items = {}
+        for item in manifest:
+            if not isinstance(item, dict):
+                item = {'path': item[0], 'local_path': item[1]}
+            items[item['path']] = item
+
+        def download(path):
+            item = items[path]
+            return download_file(self, path, item.get('local_path') or os.path.basename(path),
+                                 parallel=1, sha256=item.get('sha256'), verify_zip=verify_zip)
+
+        return self._fan_out(download, list(items), max_workers)
+
+    def get_storages(self, fresh=False):
+        return self._get_cached('storages', self.api + "/storage", fresh)
+
     def get_bucket_cred(self, id: str):
         url = self.api + "/v2/vault/getBucketToken"
         payload = {
             'bucketID': id
         }
-        req = self.session.post(url, json=payload, headers = self.headers)
+        req = self._request('POST', url, json=payload)
         req.raise_for_status()
-        data = json.loads(req.text)
+        data = self.decode(req.content)
         return data 
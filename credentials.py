@@ -0,0 +1,200 @@
+import datetime
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# fields a bucket token may carry its expiry in, checked case-insensitively
+EXPIRY_FIELDS = ('expiration', 'expires', 'expiresat', 'expires_at', 'expiry', 'expiretime', 'expire_time')
+
+# credential fields of an S3 bucket token, mapped to the credential_process output
+AWS_FIELDS = {
+    'AccessKeyId': ('accesskeyid', 'access_key_id', 'aws_access_key_id'),
+    'SecretAccessKey': ('secretaccesskey', 'secret_access_key', 'aws_secret_access_key'),
+    'SessionToken': ('sessiontoken', 'session_token', 'aws_session_token'),
+}
+
+
+def _find(data, names):
+    # depth first search of nested dicts for the first of names
+    if not isinstance(data, dict):
+        return None
+    for key, value in data.items():
+        if key.lower() in names and value not in (None, ''):
+            return value
+    for value in data.values():
+        found = _find(value, names)
+        if found is not None:
+            return found
+    return None
+
+
+def _timestamp(value):
+    if isinstance(value, (int, float)):
+        # some services send milliseconds
+        return value / 1000.0 if value > 1e12 else float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.timestamp()
+
+
+def cred_expiry(cred):
+    """
+      The time a bucket token expires, or None when it does not say.
+    """
+    value = _find(cred, EXPIRY_FIELDS)
+    return _timestamp(value) if value is not None else None
+
+
+def credential_process_output(cred):
+    """
+      The AWS credential_process JSON for an S3 bucket token, or the token
+      itself for other providers.
+    """
+    output = {'Version': 1}
+    for field, names in AWS_FIELDS.items():
+        value = _find(cred, names)
+        if value is not None:
+            output[field] = value
+    if 'AccessKeyId' not in output or 'SecretAccessKey' not in output:
+        return cred
+    expires = cred_expiry(cred)
+    if expires is not None:
+        output['Expiration'] = datetime.datetime.fromtimestamp(expires, datetime.timezone.utc).strftime(
+            '%Y-%m-%dT%H:%M:%SZ')
+    return output
+
+
+def default_cache_dir():
+    if os.environ.get('PW_CREDENTIAL_CACHE'):
+        return os.environ['PW_CREDENTIAL_CACHE']
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pw', 'credentials')
+
+
+class CredentialCache():
+    """
+      Bucket tokens cached on disk so every process of a user shares them.
+
+      Tokens are kept in one file per bucket under cache_dir (mode 0700),
+      written 0600 through a temporary file and a rename, and named after a
+      hash of the gateway, the API key and the bucket so accounts never mix.
+      A token is used as is until refresh_ahead seconds before it expires.
+      In that window it is still returned, and one process refreshes it, in
+      a background thread with background=True or before returning
+      otherwise, while the others keep using the old token instead of
+      queueing on the lock.  Less than min_valid seconds before expiry every
+      caller waits for the new token.  Tokens that do not say when they
+      expire are kept for default_ttl seconds.
+    """
+
+    def __init__(self, client, cache_dir=None, refresh_ahead=600, min_valid=60, default_ttl=900,
+                 background=False):
+        self.client = client
+        self.cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
+        self.refresh_ahead = refresh_ahead
+        self.min_valid = min_valid
+        self.default_ttl = default_ttl
+        self.background = background
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        self.account = hashlib.sha256((client.url + '\0' + client.key).encode()).hexdigest()[:16]
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+
+    def _path(self, bucket):
+        name = hashlib.sha256((self.account + '\0' + bucket).encode()).hexdigest()[:32]
+        return os.path.join(self.cache_dir, name + '.json')
+
+    def _load(self, bucket):
+        try:
+            with open(self._path(bucket)) as f:
+                entry = json.load(f)
+            return entry['cred'], entry['expires']
+        except (OSError, ValueError, KeyError):
+            return None, 0
+
+    def _save(self, bucket, cred, expires):
+        fd, tmp = tempfile.mkstemp(prefix='.cred.', dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'bucket': bucket, 'cred': cred, 'expires': expires}, f)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self._path(bucket))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def _refresh(self, bucket, fetch, blocking=True):
+        # returns the new token, or None when another process holds the lock and blocking is off
+        fd = os.open(self._path(bucket) + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                return None
+            # another process may have refreshed it while we waited
+            cred, expires = self._load(bucket)
+            if cred is not None and expires - time.time() > self.refresh_ahead:
+                return cred
+            cred = fetch()
+            expires = cred_expiry(cred)
+            if expires is None:
+                expires = time.time() + self.default_ttl
+            self._save(bucket, cred, expires)
+            return cred
+        finally:
+            os.close(fd)
+
+    def _refresh_background(self, bucket, fetch):
+        with self.lock:
+            if bucket in self.refreshing:
+                return
+            self.refreshing.add(bucket)
+
+        def run():
+            try:
+                self._refresh(bucket, fetch, blocking=False)
+            except Exception:
+                # the old token is still good, the next call tries again
+                pass
+            finally:
+                with self.lock:
+                    self.refreshing.discard(bucket)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get(self, bucket, fetch=None):
+        """
+          The token for bucket, a bucket id unless fetch is given, in which
+          case fetch() gets a new token and bucket is only the cache key.
+        """
+        if fetch is None:
+            fetch = lambda: self.client.get_bucket_cred(bucket)
+        cred, expires = self._load(bucket)
+        remaining = expires - time.time()
+        if cred is not None and remaining > self.refresh_ahead:
+            return cred
+        if cred is not None and remaining > self.min_valid:
+            if self.background:
+                self._refresh_background(bucket, fetch)
+                return cred
+            return self._refresh(bucket, fetch, blocking=False) or cred
+        return self._refresh(bucket, fetch)
+
+    def invalidate(self, bucket):
+        try:
+            os.remove(self._path(bucket))
+        except FileNotFoundError:
+            pass
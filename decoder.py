@@ -0,0 +1,90 @@
+import codecs
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def stdlib_loads(data):
+    # json.loads takes bytes directly and detects the utf-8/16/32 encoding itself
+    return json.loads(data)
+
+
+DECODERS = {
+    'json': stdlib_loads,
+}
+if orjson is not None:
+    DECODERS['orjson'] = orjson.loads
+
+
+def get_decoder(decoder=None):
+    """
+      Return a function that parses a JSON response body given as bytes.
+      decoder is a callable, the name of a backend ('orjson', 'json') or None
+      for the fastest backend installed.
+    """
+    if callable(decoder):
+        return decoder
+    if decoder is None:
+        return DECODERS.get('orjson', stdlib_loads)
+    if decoder not in DECODERS:
+        raise Exception("JSON decoder " + decoder + " is not available")
+    return DECODERS[decoder]
+
+
+def iter_json_array(chunks):
+    """
+      Yield the elements of a JSON array one by one while it is still being
+      read from an iterable of byte chunks, so the whole document never has
+      to be held in memory.
+    """
+    text = codecs.getincrementaldecoder('utf-8')()
+    parser = json.JSONDecoder()
+    chunks = iter(chunks)
+    buf = ''
+    pos = 0
+    done = False
+    started = False
+
+    def more():
+        nonlocal buf, pos, done
+        chunk = next(chunks, None)
+        if chunk is None:
+            buf = buf[pos:] + text.decode(b'', final=True)
+            done = True
+        else:
+            buf = buf[pos:] + text.decode(chunk)
+        pos = 0
+
+    while True:
+        # skip whitespace and separators, reading more when the buffer runs dry
+        while pos < len(buf) and (buf[pos].isspace() or (started and buf[pos] == ',')):
+            pos += 1
+        if pos >= len(buf):
+            if done:
+                raise ValueError("JSON array is not terminated")
+            more()
+            continue
+        if not started:
+            if buf[pos] != '[':
+                raise ValueError("JSON response is not an array")
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == ']':
+            return
+        try:
+            value, end = parser.raw_decode(buf, pos)
+        except ValueError:
+            if done:
+                raise
+            more()
+            continue
+        if not done and (end >= len(buf) or not (buf[end] in ',]' or buf[end].isspace())):
+            # a number or literal could continue in the next chunk, e.g. "-4." + "5e10"
+            more()
+            continue
+        pos = end
+        yield value
@@ -6,6 +6,7 @@ import sys
 import time
 
 from client import Client
+from tail import LogTail
 
 # inputs
 pw_url = "https://noaa.parallel.works"
@@ -66,20 +67,15 @@ f.close()
 #stream_file = 'stream/runner.out'
 stream_files = []
 
-class StreamFile:   #Class that holds the streaming files last line and file name
-    def __init__(self, name):
-        self.name = name
-        self.lastline = 0
-        self.genlastline = 0
-        self.runlastline = 0
-
-s = StreamFile("std.out")
-bat = StreamFile("run.bat")
-sim_info = StreamFile("sim_info.csv")
+# each LogTail keeps the byte offset it has read up to and appends only the
+# new bytes to its local file (named after the last path component)
+s = LogTail.for_job(djid, "std.out")
+bat = LogTail.for_job(djid, "run.bat")
+sim_info = LogTail.for_job(djid, "sim_info.csv")
 stream_files.append(s)
 stream_files.append(bat)
 stream_files.append(sim_info)
-print("Getting state and streaming back requested file:",s.name)
+print("Getting state and streaming back requested file:",s.remote_path)
 
 laststate=""
 
@@ -89,15 +85,14 @@ results_file = "/pw/jobs/{}/FloodResults.csv".format(djid)
 
 trys = 0
 try:
-    results = c.download_dataset(results_file)  #Download FloodResults.csv
-    with open("FloodResults.csv","wb") as f:
-        f.write(results)
+    c.download_dataset(results_file, "FloodResults.csv")  #Download FloodResults.csv
     have_results = True
-    tasks = results.decode().split()[1:]
+    with open("FloodResults.csv") as f:
+        tasks = f.read().split()[1:]
     for task in tasks: #For every task in the Results
         tokens = task.split(",")
         for file_ in tokens[2].split(";"): # Add each of the desired log files to the stream_files array
-            stream_files.append(StreamFile(file_)) 
+            stream_files.append(LogTail.for_job(djid, file_, file_.split("/")[-1]))
 except:                                # If it is not ready yet, we'll try again later
     trys += 1
 
@@ -108,15 +103,14 @@ while True:
     time.sleep(5)
     if not have_results and trys < 50: # 50 allows for ~ 5 minutes startup time in worst case scenarios
         try:
-            results = c.download_dataset(results_file)
-            with open("FloodResults.csv","wb") as f:
-                f.write(results)
+            c.download_dataset(results_file, "FloodResults.csv")
             have_results = True
-            tasks = results.decode().split()[1:]
+            with open("FloodResults.csv") as f:
+                tasks = f.read().split()[1:]
             for task in tasks:
                 tokens = task.split(",")
                 for file_ in tokens[2].split(";"):
-                    stream_files.append(StreamFile(file_))
+                    stream_files.append(LogTail.for_job(djid, file_, file_.split("/")[-1]))
         except Exception as e:
             print(Exception)
             trys += 1
@@ -131,15 +125,10 @@ while True:
         print(state)
         laststate=state
     
-    for stream in stream_files:
-        tail = c.get_job_tail(djid,stream.name,stream.lastline) # this is where I get the job tail to append last line
-        try:
-            if (tail != "" and "error reading file" not in tail):
-                with open(stream.name.split("/")[-1],"w+") as f:  #need to shorten path here to ensure writability. Other method would be to force create directories
-                    f.write(tail)  #Writing these out to their own files instead of std.out
-                stream.lastline+=len(list(filter(None, tail.split("\n"))))
-        except Exception as e:
-            print(e)
+    # fetch the new bytes of every streamed file at once and append them locally
+    written, errors = c.tail_files(stream_files)
+    for stream, e in errors.items():
+        print(stream.remote_path, e)
     
     ## Get run credits
     job_info = c.get_job_credit_info(djid)
@@ -160,21 +149,18 @@ print("Workflow Complete...")
 ##Download all results files
 
 job_prefix = "/pw/jobs/{}/".format(djid) 
-simnum = 1
+manifest = []
 with open("FloodResults.csv","r") as results:
     results.readline() #Ignore Headers
-    for line in results.readlines():
+    for simnum, line in enumerate(results.readlines(), 1):
         tokens = line.split(",")
-        res_file = tokens[3]
-        zip_path = job_prefix + res_file
-        try:
-            results = c.download_dataset(zip_path)
-            with open("res{}.zip".format(simnum),"wb") as result:
-                result.write(results)
-        except Exception as e:
-            print("Could not download results file {}".format(res_file))
-            print(e)
-        simnum +=1
+        manifest.append((job_prefix + tokens[3], "res{}.zip".format(simnum)))
+
+# download every results zip at once, each one is checked before it is kept
+downloaded, errors = c.download_many(manifest, max_workers=8, verify_zip=True)
+for zip_path, e in errors.items():
+    print("Could not download results file {}".format(zip_path[len(job_prefix):]))
+    print(e)
             
 
 # view job files as an example
@@ -13,11 +13,11 @@
                             line.  Treat this file as any secure file and place in 
                             .ssh directory.  Change permissions to mode 600.
 
-  New files created:
-    $HOME/.hosts - this is a new file created every time the script is run.  
-                   Do not modify this file externally as any change will be 
-                   lost.  If no active clusters exists, the file will be created
-                   with one commented line.  For the hosts to be recognized,
+  Files updated:
+    $HOME/.hosts - the active clusters are merged into this file by name and
+                   entries for clusters that are now off are removed, other
+                   entries are kept.  The file is locked while it is updated
+                   and replaced atomically.  For the hosts to be recognized,
                    the HOSTALIASES environment variable must point to this
                    file (i.e. export HOSTALIASES=$HOME/.hosts).
 """
@@ -27,14 +27,19 @@ import json
 import os
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from hosts import HostsFile
+
 # Get user specific files
 homedir = os.environ['HOME']
-# The .hosts file will get re-written every time
+# The .hosts file is merged with the active clusters
 hostsfile = homedir + '/.hosts'
 keyfile = homedir + '/.ssh/pw_api.key'
 
 # Prepare a header to go into the user's .hosts file
-cluster_hosts = [f'# Generated Automatically ' + os.path.basename(__file__)]
+hosts_header = '# Generated Automatically ' + os.path.basename(__file__)
+cluster_hosts = {}
+clusters_off = set()
 
 # get my personal API key
 try:
@@ -74,14 +79,16 @@ if res:
       ip = cluster['state']['masterNode'] 
       entry = ' '.join([name, ip])
       print (entry)
-      cluster_hosts.append(entry)
+      cluster_hosts[name] = ip
+    else:
+      clusters_off.add(cluster['type'])
   # print (cluster_hosts)
   
-  # Generate the user's local .hosts file
-  with open(hostsfile, 'w+') as f:
-    f.writelines("%s\n" % l for l in cluster_hosts)
+  # Merge the active clusters into the user's local .hosts file
+  if HostsFile(hostsfile, hosts_header).update(cluster_hosts, remove=clusters_off):
     print('SUCCESS - the', hostsfile, 'was updated.')
-  f.close() 
+  else:
+    print('The', hostsfile, 'is already up to date.')
   
 else:
   print ("Connection unsuccessful - can't connect to Parallel Works NOAA gateway")
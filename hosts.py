@@ -0,0 +1,91 @@
+import fcntl
+import os
+import tempfile
+
+
+class HostsFile():
+    """
+      Manages a HOSTALIASES style file of "name ip" lines, such as ~/.hosts.
+
+      update() merges entries by cluster name instead of rewriting the file
+      with only the clusters of the current run.  It holds an exclusive lock
+      on path.lock while it reads, merges and writes, so scripts running at
+      the same time do not lose each other's entries.  The new file is written
+      to a temporary file in the same directory and renamed over the old one,
+      so readers never see a half-written file, and nothing is written at all
+      when the content did not change.
+    """
+
+    def __init__(self, path, header='# Generated Automatically'):
+        self.path = path
+        self.header = header
+
+    def _read(self):
+        # returns the comment lines and the entries in file order
+        comments = []
+        entries = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    if line.startswith('#'):
+                        comments.append(line)
+                        continue
+                    fields = line.split()
+                    if len(fields) >= 2:
+                        entries[fields[0]] = fields[1]
+        except FileNotFoundError:
+            pass
+        return comments, entries
+
+    def read(self):
+        return self._read()[1]
+
+    def _render(self, comments, entries):
+        lines = comments if comments else [self.header]
+        lines = lines + [' '.join([name, ip]) for name, ip in entries.items()]
+        return ''.join('%s\n' % l for l in lines)
+
+    def _write(self, content):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix='.hosts.', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(self.path):
+                os.chmod(tmp, os.stat(self.path).st_mode & 0o777)
+            else:
+                os.chmod(tmp, 0o644)
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def update(self, entries=None, remove=()):
+        """
+          Add or replace the given name -> ip entries and drop the names in
+          remove.  Entries without an IP are skipped.  Returns True if the
+          file was written.
+        """
+        entries = {name: ip for name, ip in (entries or {}).items() if ip}
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                comments, current = self._read()
+                before = self._render(comments, current) if os.path.exists(self.path) else None
+                for name in remove:
+                    if name not in entries:
+                        current.pop(name, None)
+                current.update(entries)
+                after = self._render(comments, current)
+                if after == before:
+                    return False
+                self._write(after)
+                return True
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
@@ -0,0 +1,52 @@
+class ClusterIndex():
+    """
+      Lookup tables built once over a resources or v3 clusters list, keyed by
+      (namespace, name), id, exact name and lowercase name.  v2 resources
+      carry no namespace and are indexed under (None, name).
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self.by_key = {}
+        self.by_id = {}
+        self.by_name = {}
+        self.by_lower_name = {}
+        for record in records:
+            name = record.get('name')
+            if name is None:
+                continue
+            self.by_key[(record.get('namespace'), name)] = record
+            self.by_name.setdefault(name, record)
+            self.by_lower_name.setdefault(name.lower(), []).append(record)
+            id = record.get('id', record.get('_id'))
+            if id is not None:
+                self.by_id[id] = record
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def get(self, name, namespace=None):
+        # without a namespace fall back to the first record with that exact name
+        if namespace is None:
+            return self.by_key.get((None, name), self.by_name.get(name))
+        return self.by_key.get((namespace, name))
+
+    def get_id(self, id):
+        return self.by_id.get(id)
+
+    def find(self, name):
+        return list(self.by_lower_name.get(name.lower(), []))
+
+
+def parse_ref(ref, default_namespace=None):
+    """
+      Split a 'namespace/name' cluster reference into a (namespace, name)
+      tuple, using default_namespace when the reference has no namespace.
+    """
+    parts = ref.split('/', 1)
+    if len(parts) == 2:
+        return parts[0], parts[1]
+    return default_namespace, parts[0]
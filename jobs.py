@@ -0,0 +1,212 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+
+from poller import PollScheduler
+
+# job states after which a job does not change any more
+TERMINAL_STATES = ('ok', 'completed', 'error', 'failed', 'deleted', 'cancelled', 'canceled')
+
+
+class JobError(Exception):
+
+    def __init__(self, key, reason):
+        Exception.__init__(self, '%s/%s: %s' % (key[0], key[1], reason))
+        self.key = key
+        self.reason = reason
+
+
+class JobTimeout(JobError):
+    pass
+
+
+def job_id(job):
+    for field in ('id', 'jobId', 'jid'):
+        if job.get(field) is not None:
+            return str(job[field])
+    return None
+
+
+def job_state(job):
+    return job.get('status') or job.get('state')
+
+
+def job_finished(job):
+    return str(job_state(job)).lower() in TERMINAL_STATES
+
+
+def _job_list(data):
+    # the jobs list is either a bare array or wrapped in an object
+    if isinstance(data, dict):
+        data = data.get('jobs') or data.get('data') or []
+    return [job for job in data if isinstance(job, dict)]
+
+
+class JobTracker():
+    """
+      Follows any number of workflow jobs until they finish.
+
+      Jobs are added as (workflow, job id) and each has its own adaptive
+      poll time: a job that just changed state is checked again after
+      fast_interval and one that keeps running backs off to max_interval.
+      Each tick makes one jobs list call per workflow that has jobs due, so
+      500 jobs of a handful of workflows cost a handful of calls, and only
+      jobs missing from the list are fetched one by one.
+
+      The jobs list (GET /v2/workflows/<name>/jobs) is an assumption, the
+      platform only documents /v2/workflows/<name>/jobs/<id>.  When the list
+      call fails the jobs of that workflow are fetched one by one instead,
+      and a workflow whose list is not found is not asked for it again.
+
+      add() returns a Future per job that resolves to the job record once it
+      reaches a state in TERMINAL_STATES, whatever that state is, or fails
+      with JobError when the job cannot be found or JobTimeout.  Iterate the
+      tracker to get (key, job) pairs in the order the jobs finish, or use
+      run() or start() as with waiter.ClusterWaiter.
+    """
+
+    def __init__(self, client, timeout=None, scheduler=None, on_change=None):
+        self.client = client
+        self.timeout = timeout
+        self.scheduler = scheduler if scheduler is not None else PollScheduler(
+            interval=5.0, fast_interval=2.0, max_interval=60.0)
+        self.on_change = on_change
+        self.futures = {}
+        self.laststate = {}
+        self.finished = queue.Queue()
+        self.unlisted = set()
+        self.deadline = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def add(self, workflow, jid, callback=None):
+        """
+          Track a job.  callback(key, job, error) is called once it finished,
+          key being (workflow, job id).
+        """
+        key = (workflow, str(jid))
+        with self.lock:
+            if key in self.futures:
+                future = self.futures[key]
+            else:
+                future = Future()
+                future.set_running_or_notify_cancel()
+                self.futures[key] = future
+                self.scheduler.add(key)
+        if callback is not None:
+            future.add_done_callback(lambda f: callback(key, None if f.exception() else f.result(), f.exception()))
+        return future
+
+    def pending(self):
+        with self.lock:
+            return [key for key, future in self.futures.items() if not future.done()]
+
+    def _settle(self, key, job=None, error=None):
+        self.scheduler.discard(key)
+        if error is not None:
+            self.futures[key].set_exception(error)
+        else:
+            self.futures[key].set_result(job)
+        self.finished.put(key)
+
+    def _check(self, key, job):
+        state = job_state(job)
+        changed = self.laststate.get(key) != state
+        if changed:
+            self.laststate[key] = state
+            if self.on_change is not None:
+                self.on_change(key, job)
+        if job_finished(job):
+            self._settle(key, job)
+        else:
+            self.scheduler.observe(key, changed=changed, near_ready=changed)
+
+    def poll(self):
+        """
+          Check the jobs that are due once and return how many are still
+          pending.
+        """
+        due = {}
+        for key in self.scheduler.due():
+            if key in self.futures and not self.futures[key].done():
+                due.setdefault(key[0], []).append(key)
+        for workflow, keys in due.items():
+            jobs = {}
+            if workflow not in self.unlisted:
+                try:
+                    for job in _job_list(self.client.get_workflow_jobs(workflow)):
+                        jobs[job_id(job)] = job
+                except requests.exceptions.HTTPError as e:
+                    if e.response is not None and e.response.status_code in (404, 405, 501):
+                        self.unlisted.add(workflow)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    pass
+            for key in keys:
+                job = jobs.get(key[1])
+                if job is None:
+                    # older jobs can drop off the list, or there is no list
+                    try:
+                        job = self.client.get_job_status(workflow, key[1])
+                    except requests.exceptions.HTTPError as e:
+                        if e.response is not None and e.response.status_code == 404:
+                            self._settle(key, error=JobError(key, 'not found: %s' % e))
+                        else:
+                            # the gateway is struggling, not the job, ask again on a later tick
+                            self.scheduler.observe(key)
+                        continue
+                    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                        self.scheduler.observe(key)
+                        continue
+                self._check(key, job)
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            for key in self.pending():
+                self._settle(key, error=JobTimeout(key, 'timed out waiting for job'))
+        return len(self.pending())
+
+    def run(self):
+        """
+          Poll until every job finished or timed out and return the dict of
+          key -> Future.
+        """
+        if self.timeout is not None and self.deadline is None:
+            self.deadline = time.monotonic() + self.timeout
+        while self.poll():
+            delay = self.scheduler.next_delay()
+            if self.deadline is not None:
+                delay = min(delay, max(0, self.deadline - time.monotonic()))
+            time.sleep(delay)
+        return dict(self.futures)
+
+    def __iter__(self):
+        """
+          Poll in a background thread and yield (key, job) as each job
+          finishes, job being None when it failed or timed out.
+        """
+        if self.thread is None:
+            self.start()
+        returned = 0
+        while returned < len(self.futures):
+            key = self.finished.get()
+            returned += 1
+            future = self.futures[key]
+            yield key, None if future.exception() else future.result()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run_safely, daemon=True)
+        self.thread.start()
+        return self
+
+    def _run_safely(self):
+        try:
+            self.run()
+        except Exception as e:
+            for key in self.pending():
+                self._settle(key, error=JobError(key, 'tracker stopped: %s' % e))
+
+    def join(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+        return dict(self.futures)
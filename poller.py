@@ -0,0 +1,74 @@
+import random
+import time
+
+
+class PollScheduler():
+    """
+      Keeps a separate next-check time for every key being polled.
+
+      A key whose state did not change backs off geometrically up to
+      max_interval, a key whose state changed goes back to interval, and a
+      key that looks close to ready is checked every fast_interval.  All
+      delays are jittered so that many scripts polling the same gateway do
+      not fall into lock step.
+    """
+
+    def __init__(self, interval=5.0, fast_interval=1.0, max_interval=30.0, backoff=1.5, jitter=0.2):
+        self.base_interval = interval
+        self.fast_interval = fast_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.next_check = {}
+        self.interval = {}
+
+    def __len__(self):
+        return len(self.next_check)
+
+    def __contains__(self, key):
+        return key in self.next_check
+
+    def add(self, key, delay=0):
+        self.interval[key] = self.base_interval
+        self.next_check[key] = time.monotonic() + delay
+
+    def discard(self, key):
+        self.next_check.pop(key, None)
+        self.interval.pop(key, None)
+
+    def due(self):
+        now = time.monotonic()
+        return [key for key, when in self.next_check.items() if when <= now]
+
+    def observe(self, key, changed=False, near_ready=False):
+        if key not in self.next_check:
+            return
+        if near_ready:
+            interval = self.fast_interval
+        elif changed:
+            interval = self.base_interval
+        else:
+            interval = min(self.max_interval, self.interval[key] * self.backoff)
+        self.interval[key] = interval
+        spread = interval * self.jitter
+        self.next_check[key] = time.monotonic() + interval + random.uniform(-spread, spread)
+
+    def next_delay(self):
+        if not self.next_check:
+            return 0
+        return max(0, min(self.next_check.values()) - time.monotonic())
+
+    def wait(self):
+        delay = self.next_delay()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def v2_near_ready(cluster):
+    # workers have been requested or are partly registered, the master node is next
+    state = cluster.get('state') or {}
+    return bool(state.get('requestedWorkers') or state.get('registeredWorkers'))
+
+
+def v3_near_ready(cluster):
+    return cluster.get('currentSessionStatus') == 'provisioning'
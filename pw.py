@@ -0,0 +1,705 @@
+#!/usr/bin/env python3
+
+"""
+  One command for the Parallel Works automation scripts.
+
+    python3 pw.py start pcluster_noaa,gcluster_noaa
+    python3 pw.py start-v3 mycluster + run myworkflow mycluster + stop-v3 mycluster
+    python3 pw.py <command> --help
+
+  Commands joined with "+" run one after the other in the same process and
+  share one client, so the identity, the cluster lists and the connections
+  are reused, and the chain stops at the first command that fails.
+
+  Only the standard library is loaded until a command needs the platform,
+  and no platform call is made before the arguments are parsed.  The
+  account identity is only fetched by the commands that use it.
+
+  Settings come from the environment:
+
+    PW_PLATFORM_HOST - the Parallel Works platform host name, e.g. cloud.parallel.works
+    PW_API_KEY       - the API key, otherwise read from $HOME/.ssh/pw_api.key
+    PW_MAX_PARALLEL  - requests and ssh commands run at once (8)
+    PW_MAX_AGE       - seconds old a cluster list may be when deciding what to change (0)
+    PW_SSH_TIMEOUT   - seconds each test ssh command may take (60)
+    PW_WAIT_TIMEOUT  - seconds to wait for clusters to come up (3600)
+
+  Critical files that must exist:
+
+    $HOME/.ssh/pw_api.key - this file must contain the API key in the first and only
+                            line.  Treat this file as any secure file and place in
+                            .ssh directory.  Change permissions to mode 600.
+"""
+
+import argparse
+import os
+import sys
+
+
+class CommandError(Exception):
+    pass
+
+
+class Context():
+    """
+      What the commands of one run share.  The client and the user name are
+      created on first use.
+    """
+
+    def __init__(self, environ=None):
+        self.environ = environ if environ is not None else os.environ
+        self.max_parallel = int(self.environ.get('PW_MAX_PARALLEL', 8))
+        self.max_age = float(self.environ.get('PW_MAX_AGE', 0))
+        self.ssh_timeout = int(self.environ.get('PW_SSH_TIMEOUT', 60))
+        self.wait_timeout = int(self.environ.get('PW_WAIT_TIMEOUT', 3600))
+        self.home = self.environ.get('HOME', os.path.expanduser('~'))
+        self._client = None
+        self._user = None
+
+    def api_key(self):
+        # the environment variable PW_API_KEY takes precedence over the file $HOME/.ssh/pw_api.key
+        if self.environ.get('PW_API_KEY'):
+            return self.environ['PW_API_KEY']
+        try:
+            with open(os.path.join(self.home, '.ssh', 'pw_api.key')) as f:
+                return f.readline().strip() or None
+        except OSError:
+            return None
+
+    @property
+    def client(self):
+        if self._client is None:
+            host = self.environ.get('PW_PLATFORM_HOST')
+            if not host:
+                raise CommandError("No PW_PLATFORM_HOST environment variable found. Please set it to the Parallel Works platform host name. e.g. cloud.parallel.works")
+            api_key = self.api_key()
+            if not api_key:
+                raise CommandError("No API key found. Please set the environment variable PW_API_KEY or create the file $HOME/.ssh/pw_api.key.")
+            from client import Client
+            self._client = Client("https://" + host, api_key, store=True)
+        return self._client
+
+    @property
+    def user(self):
+        if self._user is None:
+            self._user = self.client.get_identity()['username']
+            print("\nRunning as user", self._user+'...')
+        return self._user
+
+    def refs(self, names):
+        # (namespace, name) for each v3 cluster or bucket, the user's namespace by default
+        from index import parse_ref
+        refs = []
+        for name in names:
+            if '/' not in name:
+                print("No namespace provided for", name+".", "Default to current user", self.user)
+                refs.append((self.user, name))
+            else:
+                refs.append(parse_ref(name))
+        return refs
+
+
+def _print_many(targets, results, errors, verb):
+    for target, label in targets:
+        if target in errors:
+            print("Failed to", verb, "cluster", label+":", errors[target])
+        else:
+            print(results[target])
+
+
+def _test_ssh(ctx, cluster_hosts):
+    from remote import run_on_hosts
+
+    print("\nRunning test ssh commands on the clusters...")
+
+    # run the command on every controller at once, one slow or unreachable
+    # controller does not hold up or abort the others
+    results = run_on_hosts(cluster_hosts, "sinfo", ctx.user, max_workers=ctx.max_parallel, timeout=ctx.ssh_timeout)
+    for name, result in results.items():
+        print("")
+        print(name+':', '"'+' '.join(result.args)+'"',
+              "(exit %s in %.1fs)" % (result.exit_code, result.duration))
+        print(result.stdout + result.stderr)
+
+
+def _update_hosts(ctx, cluster_hosts, clusters_off):
+    from hosts import HostsFile
+
+    # merge the started clusters into the user's local .hosts file and drop the clusters that are off
+    hostsfile = os.path.join(ctx.home, '.hosts')
+    if HostsFile(hostsfile, '# Generated Automatically pw.py').update(cluster_hosts, remove=clusters_off):
+        print('SUCCESS - the', hostsfile, 'was updated.')
+    else:
+        print('The', hostsfile, 'is already up to date.')
+
+
+def cmd_start(ctx, args):
+    """
+      Start v2 clusters, wait for their master nodes, add them to ~/.hosts
+      and run a test sinfo on each.
+    """
+    from waiter import ClusterWaiter
+
+    c = ctx.client
+    names = args.clusters.split(',')
+    print('\nStarting clusters:', names)
+    ctx.user
+    my_clusters = c.get_resource_index(fresh=ctx.max_age)
+    to_start = {}
+    for cluster_name in names:
+        print("\nChecking cluster status", cluster_name+"...")
+        cluster = my_clusters.get(cluster_name)
+        if not cluster:
+            print("No cluster found.")
+            return 1
+        if cluster['status'] == "off":
+            print("Starting cluster", cluster['name']+"...")
+            to_start[cluster['id']] = cluster['name']
+        else:
+            print(cluster_name, "already running...")
+
+    # send all the start requests at once
+    results, errors = c.start_many(list(to_start), max_workers=ctx.max_parallel)
+    _print_many(to_start.items(), results, errors, 'start')
+    if errors:
+        return 1
+
+    print("\nWaiting for", len(names), "cluster(s) to start...")
+    cluster_hosts = {}
+
+    def cluster_changed(cluster_name, cluster):
+        if cluster['status'] == 'on':
+            print(cluster_name, cluster['state'])
+
+    def cluster_ready(cluster_name, cluster, error):
+        if error is not None:
+            print("Cluster", cluster_name, "did not start:", error.reason)
+            return
+        print(' '.join([cluster_name, cluster['state']['masterNode']]))
+        cluster_hosts[cluster_name] = cluster['state']['masterNode']
+
+    # one list call per tick covers every cluster, each cluster is polled on its
+    # own adaptive schedule and gives up on error, deletion or timeout
+    waiter = ClusterWaiter(c, timeout=ctx.wait_timeout, on_change=cluster_changed)
+    for cluster_name in names:
+        waiter.add(cluster_name, callback=cluster_ready)
+    failed = [name for name, future in waiter.run().items() if future.exception() is not None]
+    if failed:
+        print('\nClusters failed to start:', failed)
+    else:
+        print('\nStarted all clusters... writing hosts file')
+
+    clusters_off = [cluster['name'] for cluster in my_clusters if cluster['status'] == 'off' and cluster['name'] not in cluster_hosts]
+    _update_hosts(ctx, cluster_hosts, clusters_off)
+    _test_ssh(ctx, cluster_hosts)
+    return 1 if failed else 0
+
+
+def cmd_start_v3(ctx, args):
+    """
+      Start v3 clusters ([namespace/]name), wait until their sessions run,
+      add them to ~/.hosts and run a test sinfo on each.
+    """
+    from waiter import ClusterWaiter, v3_ready
+
+    c = ctx.client
+    names = args.clusters.split(',')
+    print('\nStarting clusters:', names)
+    targets = ctx.refs(names)
+    my_clusters = c.get_v3_cluster_index(fresh=ctx.max_age)
+    cluster_hosts = {}
+    started = []
+    to_start = []
+    for cluster_namespace, cluster_name in targets:
+        print("\nChecking cluster status", cluster_name, "in namespace", cluster_namespace+"...")
+        cluster = my_clusters.get(cluster_name, cluster_namespace)
+        if not cluster:
+            print("No cluster found.")
+            return 1
+        if cluster['status'] == "off":
+            print("Starting cluster", cluster['name']+"...")
+            to_start.append((cluster_namespace, cluster_name))
+        elif v3_ready(cluster):
+            print(cluster_name, "already running...")
+            print(' '.join([cluster['name'], cluster['controllerIp']]))
+            cluster_hosts[cluster['name']] = cluster['controllerIp']
+            started.append((cluster_namespace, cluster_name))
+        else:
+            # on but still provisioning, wait for it like the clusters being started
+            print(cluster_name, "is starting...")
+
+    results, errors = c.start_many(to_start, max_workers=ctx.max_parallel)
+    _print_many([(target, '/'.join(target)) for target in to_start], results, errors, 'start')
+    if errors:
+        return 1
+
+    print("\nWaiting for", len(names), "cluster(s) to start...")
+
+    def cluster_changed(key, cluster):
+        if cluster['status'] == 'on':
+            print(cluster['name'], cluster['currentSessionStatus'])
+
+    def cluster_ready(key, cluster, error):
+        if error is not None:
+            print("Cluster", '/'.join(key), "did not start:", error.reason)
+            return
+        print("Cluster", cluster['name'], "is now ready. Controller IP:", cluster['controllerIp'])
+        cluster_hosts[cluster['name']] = cluster['controllerIp']
+
+    waiter = ClusterWaiter(c, timeout=ctx.wait_timeout, on_change=cluster_changed)
+    for key in targets:
+        if key not in started:
+            waiter.add(key, callback=cluster_ready)
+    failed = ['/'.join(key) for key, future in waiter.run().items() if future.exception() is not None]
+    if failed:
+        print('\nClusters failed to start:', failed)
+    else:
+        print('\nStarted all clusters!')
+
+    clusters_off = [cluster['name'] for cluster in my_clusters if cluster['status'] == 'off' and cluster['name'] not in cluster_hosts]
+    _update_hosts(ctx, cluster_hosts, clusters_off)
+    _test_ssh(ctx, cluster_hosts)
+    return 1 if failed else 0
+
+
+def _stop(ctx, args, names, clusters, label):
+    from teardown import stop_clusters
+
+    user = None
+    drain_timeout = None
+    if args.drain:
+        user = ctx.user
+        drain_timeout = args.drain_timeout
+        print("\nChecking the job queues of", len(clusters), "cluster(s)...")
+
+    def queue_checked(counts):
+        for ref, count in counts.items():
+            if count:
+                print(label(ref), "has", count, "queued or running job(s)")
+
+    def cluster_changed(ref, cluster):
+        print(label(ref), cluster['status'])
+
+    # send all the stop requests at once, then wait until every cluster reports off
+    results = stop_clusters(ctx.client, clusters, user, drain_timeout, timeout=ctx.wait_timeout,
+                            wait=not args.no_wait, max_workers=ctx.max_parallel, ssh_timeout=ctx.ssh_timeout,
+                            on_check=queue_checked, on_change=cluster_changed)
+    if results:
+        print("")
+    for ref, result in results.items():
+        if result.state == 'off':
+            print(label(ref), "stopped in %.1fs" % result.latency)
+        elif result.state == 'sent':
+            print(result.response)
+        elif result.state == 'busy':
+            print(label(ref), "left running with", result.jobs, "queued or running job(s)")
+        elif result.state == 'unreachable':
+            print(label(ref), "left running, the job queue could not be checked")
+        else:
+            print("Failed to stop cluster", label(ref)+":", result.error)
+    if any(result.state in ('failed', 'timeout') for result in results.values()):
+        return 1
+    left = [ref for ref, result in results.items() if not result.ok]
+    if left:
+        print("\nLeft", len(left), "cluster(s) running:", [label(ref) for ref in left])
+    print("\nStopped", len(names) - len(left), "clusters...\n")
+    return 0
+
+
+def cmd_stop(ctx, args):
+    """
+      Stop v2 clusters and wait until they are off.  With --drain, clusters
+      with queued or running Slurm jobs are left running.
+    """
+    c = ctx.client
+    names = args.clusters.split(',')
+    my_clusters = c.get_resource_index(fresh=ctx.max_age)
+    to_stop = {}
+    for cluster_name in names:
+        print("\nChecking cluster status", cluster_name+"...")
+        cluster = my_clusters.get(cluster_name)
+        if not cluster:
+            print("No cluster found.")
+            return 1
+        if cluster['status'] == "on":
+            print("Stopping cluster", cluster['name']+"...")
+            to_stop[cluster['name']] = cluster
+        else:
+            print(cluster_name, "already stopped...")
+
+    return _stop(ctx, args, names, to_stop, str)
+
+
+def cmd_stop_v3(ctx, args):
+    """
+      Stop v3 clusters ([namespace/]name) and wait until they are off.  With
+      --drain, clusters with queued or running Slurm jobs are left running.
+    """
+    c = ctx.client
+    names = args.clusters.split(',')
+    targets = ctx.refs(names)
+    my_clusters = c.get_v3_cluster_index(fresh=ctx.max_age)
+    to_stop = {}
+    for cluster_namespace, cluster_name in targets:
+        print("\nChecking cluster status", cluster_name, "in namespace", cluster_namespace+"...")
+        cluster = my_clusters.get(cluster_name, cluster_namespace)
+        if not cluster:
+            print("No cluster found.")
+            return 1
+        if cluster['status'] == "on":
+            print("Stopping cluster", cluster['name']+"...")
+            to_stop[(cluster_namespace, cluster_name)] = cluster
+        else:
+            print(cluster_name, "already stopped...")
+
+    return _stop(ctx, args, names, to_stop, '/'.join)
+
+
+def cmd_reap(ctx, args):
+    """
+      Check every running cluster for queued or running Slurm jobs and
+      allocated cpus, and stop the clusters that have been idle for longer
+      than --idle-minutes.  With --every, check again every that many
+      seconds until interrupted.
+    """
+    import time
+    from reaper import IdleHistory, reap
+    from remote import SSHPool
+
+    labels = {True: '/'.join, False: str}
+    history = IdleHistory(args.history)
+    # repeated cycles reuse their ssh connections
+    pool = SSHPool(idle_timeout=max(300, 2 * (args.every or 0))) if args.every else None
+    stopped = {}
+    try:
+        while True:
+            start = time.monotonic()
+            usage, idle, stopped = reap(ctx.client, ctx.user, history, args.idle_minutes * 60,
+                                        v2=not args.v3_only, v3=not args.v2_only, dry_run=args.dry_run,
+                                        wait=not args.no_wait, timeout=ctx.wait_timeout, max_workers=args.parallel,
+                                        ssh_timeout=ctx.ssh_timeout, pool=pool)
+            print("\nChecked", len(usage), "running cluster(s), the cycle took %.1fs" % (time.monotonic() - start))
+            for ref, checked in usage.items():
+                label = labels[isinstance(ref, tuple)](ref)
+                if checked is None:
+                    print(label, "could not be checked")
+                else:
+                    print(label, checked['jobs'], "job(s),", checked['allocated_cpus'], "of",
+                          checked['total_cpus'], "cpus allocated, idle for %.0f min" % (idle[ref] / 60))
+            for ref, result in stopped.items():
+                label = labels[isinstance(ref, tuple)](ref)
+                if result.state == 'off':
+                    print("Stopped idle cluster", label, "in %.1fs" % result.latency)
+                elif result.state == 'sent':
+                    print("Stopping idle cluster", label)
+                elif result.state in ('busy', 'unreachable'):
+                    print("Left", label, "running, it is no longer idle or could not be checked")
+                else:
+                    print("Failed to stop cluster", label+":", result.error)
+            if not args.every:
+                break
+            time.sleep(max(0, args.every - (time.monotonic() - start)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if pool is not None:
+            pool.close()
+    if any(result.state in ('failed', 'timeout') for result in stopped.values()):
+        return 1
+    return 0
+
+
+def _resource_label(ctx, cluster_to_run_in):
+    # the resource_label input of a workflow run, the user workspace without a cluster
+    resource_id = 'user_workspace'
+    if cluster_to_run_in is not None:
+        matches = ctx.client.get_resource(cluster_to_run_in, fresh=ctx.max_age)
+        if not matches:
+            raise CommandError("No resources found with name " + cluster_to_run_in)
+        resource = matches[0]
+        if resource["status"] != "on":
+            raise CommandError("Resource " + cluster_to_run_in + " is currently not on")
+        resource_id = resource["id"]
+        print("Running workflow in cluster " + cluster_to_run_in)
+    else:
+        print("Running workflow in user workspace")
+    return {"id": resource_id, "type": "computeResource"}
+
+
+def cmd_run(ctx, args):
+    """
+      Start a workflow on a cluster, or in the user workspace without one.
+    """
+    import json
+
+    print("Starting workflow " + args.workflow)
+    if args.inputs is not None:
+        with open(args.inputs) as f:
+            inputs = json.load(f)
+    else:
+        inputs = {
+            "input1": "value1",
+            # Location of the main script to run
+            "startCmd": "main.sh",
+        }
+    # Define which resource to run (should not be changed)
+    inputs["resource_label"] = _resource_label(ctx, args.cluster)
+    response = ctx.client.run_workflow(args.workflow, inputs)
+    print(response["message"])
+    return 0
+
+
+def _v3_resource(ctx, name):
+    # the pwrl_host.resource input of a workflow run on a v3 cluster, as in v3_cluster_examples/runV3Workflow.py
+    import requests
+
+    namespace, cluster_name = ctx.refs([name])[0]
+    label = namespace + "/" + cluster_name
+    try:
+        cluster = ctx.client.get_v3_cluster(namespace, cluster_name, fresh=ctx.max_age)
+    except requests.exceptions.HTTPError:
+        raise CommandError("Cluster " + cluster_name + " not found in namespace " + namespace)
+    if cluster['status'] != "on" or cluster.get('currentSessionStatus') != "running":
+        raise CommandError("Cluster " + label + " is not running, please turn it on before submitting a workflow")
+    print("Running workflow in cluster " + label)
+    return {
+        "type": "computeResource",
+        "id": cluster['id'],
+        "provider": cluster['type'],
+        "ip": cluster['controllerIp'],
+        "namespace": cluster['namespace'],
+        "name": cluster['name'],
+    }
+
+
+def cmd_batch(ctx, args):
+    """
+      Start a workflow once for every input set in a JSONL or CSV file,
+      recording each submission in <file>.results.jsonl.  Run it again to
+      submit what failed or was never submitted.  A v2 cluster goes into
+      the resource_label input, a v3 cluster given with --v3 into
+      pwrl_host.resource.
+    """
+    from sweep import SweepResults, read_inputs, run_sweep
+
+    if args.v3 is not None:
+        if args.cluster is not None:
+            raise CommandError("Give either a v2 cluster or --v3, not both")
+        base = {"pwrl_host": {"resource": _v3_resource(ctx, args.v3)}}
+    else:
+        base = {"resource_label": _resource_label(ctx, args.cluster)}
+    results = SweepResults(args.file + '.results.jsonl')
+
+    def report(record):
+        if record['status'] == 'submitted':
+            print(record['id'], 'submitted', record.get('job_id') or '', record.get('message') or '')
+        else:
+            print(record['id'], 'failed:', record['error'])
+
+    print("Starting workflow " + args.workflow + " for every input set in " + args.file)
+    counts = run_sweep(ctx.client, args.workflow, read_inputs(args.file), results, base,
+                       max_workers=ctx.max_parallel,
+                       resubmit_pending=ctx.environ.get('PW_RESUBMIT_PENDING') == '1',
+                       max_failures=int(ctx.environ.get('PW_MAX_FAILURES', 20)), on_result=report)
+    print("\nSubmitted:", counts['submitted'], "Failed:", counts['failed'], "Already done:", counts['skipped'])
+    print("Results in " + results.path)
+    unsettled = [item_id for item_id, inputs in read_inputs(args.file) if results.status(item_id) != 'submitted']
+    if unsettled:
+        pending = [item_id for item_id in unsettled if results.status(item_id) == 'pending']
+        print(len(unsettled), "items are not submitted, run the command again to retry them")
+        if pending:
+            # a pending start may have reached the platform, so a rerun leaves them alone by default
+            print(len(pending), "of them may have started and are skipped on a rerun,",
+                  "set PW_RESUBMIT_PENDING=1 to submit those again too")
+        return 1
+    return 0
+
+
+def _find_bucket(c, namespace, name):
+    # a stored list can be a day old, check with the platform before saying a bucket is missing
+    for fresh in (False, True):
+        bucket = next((item for item in c.get_storages(fresh=fresh)
+                       if item["name"] == name and item["namespace"] == namespace), None)
+        if bucket and bucket['provisioned'] == True:
+            break
+    return bucket
+
+
+def cmd_bucket_cred(ctx, args):
+    """
+      Print short-term credentials for buckets ([namespace/]name).
+    """
+    from credentials import CredentialCache
+
+    names = args.buckets.split(',')
+    print('\nGenerating credentials for buckets:', names)
+    creds = CredentialCache(ctx.client)
+    refs = ctx.refs(names)
+    for bucket_namespace, bucket_name in refs:
+        print("\nLooking for bucket", bucket_name, "in namespace", bucket_namespace+"...")
+        # this logic currently only lets you get creds for buckets you own
+        bucket = _find_bucket(ctx.client, bucket_namespace, bucket_name)
+        if not bucket:
+            print("No bucket found.")
+        elif "bucket" not in bucket['type']:
+            print("Storage provided is not a bucket.")
+        elif bucket['provisioned'] != True:
+            print("Bucket provided is not currently provisioned.")
+        else:
+            print("Identified bucket", bucket['name'], "as", bucket['id'])
+            print(creds.get(bucket['id']))
+    return 0
+
+
+def cmd_credential_process(ctx, args):
+    """
+      Print the credentials of one bucket (id or namespace/name) and nothing
+      else, for the credential_process setting of cloud CLIs.
+    """
+    import json
+    from credentials import CredentialCache, credential_process_output
+
+    c = ctx.client
+
+    def fetch():
+        # bucket names are only looked up when a new token is needed
+        bucket_id = args.bucket
+        if '/' in args.bucket:
+            namespace, name = args.bucket.split('/', 1)
+            bucket = _find_bucket(c, namespace, name)
+            if bucket is None:
+                raise LookupError("No bucket found named " + args.bucket)
+            bucket_id = bucket['id']
+        return c.get_bucket_cred(bucket_id)
+
+    try:
+        cred = CredentialCache(c).get(args.bucket, fetch)
+    except Exception as e:
+        raise CommandError("Could not get credentials for bucket " + args.bucket + ": " + str(e))
+    print(json.dumps(credential_process_output(cred)))
+    return 0
+
+
+def cmd_create_v3(ctx, args):
+    """
+      Create a v3 cluster from a JSON cluster definition.
+    """
+    import json
+
+    if args.csp not in ["aws", "azure", "google"]:
+        raise CommandError("--csp invalid or not provided. Must be one of 'aws', 'azure', or 'google'.")
+    if args.definition is None:
+        raise CommandError("--definition not provided. Must provide a valid JSON formatted cluster definition.")
+    if args.name is None:
+        raise CommandError("--name not provided. Must provide a valid JSON formatted cluster definition.")
+    with open(args.definition) as f:
+        clusterJSON = json.load(f)
+    print("Creating", args.csp, "cluster", args.name)
+
+    c = ctx.client
+    user = ctx.user
+    # make sure cluster name or display name is not in use
+    # the cluster list is streamed and the download stops at the first match
+    cluster = next(
+        (item for item in c.iter_v3_clusters(fresh=True) if item["name"] == args.name or item["displayName"] == args.name), None)
+    if cluster:
+        raise CommandError("cluster " + args.name + " already exists.")
+
+    clusterData = {
+        "name": args.name,
+        "displayName": args.name,
+        "tags": "",
+        "description": "",
+        "type": args.csp+"-slurm",
+        "runTimeAlert": {
+            "enabled": False
+        }
+    }
+    c.create_v3_cluster(clusterData)
+
+    # Update the cluster definition to include configuration JSON.
+    clusterData["baseInfrastructure"] = ""
+    clusterData["group"] = ""
+    clusterData["variables"] = clusterJSON
+    clusterData["attachedStorages"] = clusterJSON["attachedStorages"]
+    c.update_v3_cluster(clusterData, user, args.name)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='pw.py', description='Parallel Works cluster automation. Join commands with "+" to run them in one process.')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    def command(name, func, summary, *arguments):
+        sub = commands.add_parser(name, help=summary, description=' '.join(func.__doc__.split()))
+        for args, kwargs in arguments:
+            sub.add_argument(*args, **kwargs)
+        sub.set_defaults(func=func)
+
+    clusters = (('clusters',), {'help': 'comma separated cluster names'})
+    cluster = (('cluster',), {'nargs': '?', 'help': 'cluster to run in, the user workspace by default'})
+    command('start', cmd_start, 'start v2 clusters and wait for them', clusters)
+    command('start-v3', cmd_start_v3, 'start v3 clusters and wait for them', clusters)
+    stop = (clusters,
+            (('--drain',), {'action': 'store_true', 'help': 'leave clusters with queued or running jobs running'}),
+            (('--drain-timeout',), {'type': float, 'default': 0, 'metavar': 'SECONDS',
+                                    'help': 'wait this long for the job queues to empty'}),
+            (('--no-wait',), {'action': 'store_true', 'help': 'do not wait for the clusters to be off'}))
+    command('stop', cmd_stop, 'stop v2 clusters and wait until they are off', *stop)
+    command('stop-v3', cmd_stop_v3, 'stop v3 clusters and wait until they are off', *stop)
+    command('reap', cmd_reap, 'stop clusters that have been idle for too long',
+            (('--idle-minutes',), {'type': float, 'default': 60, 'help': 'stop clusters idle this long (60)'}),
+            (('--dry-run',), {'action': 'store_true', 'help': 'only report, do not stop anything'}),
+            (('--every',), {'type': float, 'metavar': 'SECONDS', 'help': 'check again every SECONDS'}),
+            (('--parallel',), {'type': int, 'default': 64, 'help': 'controllers checked at once (64)'}),
+            (('--history',), {'help': 'idle history file, ~/.cache/pw/idle.json by default'}),
+            (('--no-wait',), {'action': 'store_true', 'help': 'do not wait for stopped clusters to be off'}),
+            (('--v2-only',), {'action': 'store_true'}), (('--v3-only',), {'action': 'store_true'}))
+    command('run', cmd_run, 'start a workflow', (('workflow',), {}), cluster,
+            (('--inputs',), {'help': 'JSON file with the workflow inputs'}))
+    command('batch', cmd_batch, 'start a workflow for every input set in a file', (('workflow',), {}), (('file',), {'help': 'JSONL or CSV file of input sets'}), cluster,
+            (('--v3',), {'metavar': '[NAMESPACE/]NAME', 'help': 'v3 cluster to run in'}))
+    command('bucket-cred', cmd_bucket_cred, 'print bucket credentials', (('buckets',), {'help': 'comma separated bucket names'}))
+    command('credential-process', cmd_credential_process, 'bucket credentials for credential_process', (('bucket',), {'help': 'bucket id or namespace/name'}))
+    command('create-v3', cmd_create_v3, 'create a v3 cluster', (('--csp',), {'help': 'aws, azure or google'}),
+            (('--name',), {'help': 'name of the cluster'}),
+            (('--definition',), {'help': 'JSON file to create the config from'}))
+    return parser
+
+
+def split_chain(argv):
+    chain = [[]]
+    for arg in argv:
+        if arg == '+':
+            chain.append([])
+        else:
+            chain[-1].append(arg)
+    return [segment for segment in chain if segment]
+
+
+def main(argv=None, ctx=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    # parse the whole chain first so a typo in the last command fails before the first one runs
+    steps = [parser.parse_args(segment) for segment in split_chain(argv)] or [parser.parse_args([])]
+    ctx = ctx if ctx is not None else Context()
+    try:
+        for args in steps:
+            try:
+                code = args.func(ctx, args)
+            except CommandError as e:
+                print(e, file=sys.stderr)
+                code = 1
+            if code:
+                return code
+        return 0
+    finally:
+        if ctx._client is not None:
+            # let the background refreshes of the metadata store land before the process exits
+            ctx._client.wait_revalidated(10)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
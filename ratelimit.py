@@ -0,0 +1,124 @@
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# endpoint classes a limit can be set for
+ENDPOINT_CLASSES = ('list', 'mutate', 'vault')
+
+
+class TokenBucket():
+    """
+      Token bucket holding up to capacity tokens and refilling at rate tokens
+      per second.  With a state_file the bucket lives in that file and is
+      updated under an exclusive lock, so every thread and process pointing
+      at the same file draws from one budget.
+    """
+
+    def __init__(self, rate, capacity=None, state_file=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.state_file = state_file
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def _take(self, tokens, state):
+        # refill from the time elapsed, then take the tokens or return how long to wait
+        now = time.time()
+        available = min(self.capacity, state['tokens'] + max(0.0, now - state['updated']) * self.rate)
+        state['updated'] = now
+        if available >= tokens:
+            state['tokens'] = available - tokens
+            return 0.0
+        state['tokens'] = available
+        return (tokens - available) / self.rate
+
+    def _take_shared(self, tokens):
+        with open(self.state_file, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read())
+                except ValueError:
+                    state = {'tokens': self.capacity, 'updated': time.time()}
+                wait = self._take(tokens, state)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return wait
+
+    def acquire(self, tokens=1):
+        """
+          Block until tokens are available and take them.
+        """
+        while True:
+            with self.lock:
+                if self.state_file is not None:
+                    wait = self._take_shared(tokens)
+                else:
+                    state = {'tokens': self.tokens, 'updated': self.updated}
+                    wait = self._take(tokens, state)
+                    self.tokens, self.updated = state['tokens'], state['updated']
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+class RateLimiter():
+    """
+      One token bucket per endpoint class ('list', 'mutate', 'vault').
+      limits maps a class to a rate in calls per second or to a
+      (rate, burst) pair, classes without a limit are not throttled.  When
+      shared_key is given the buckets are kept in the temp directory under a
+      name derived from it, so all processes using the same API key share
+      the budget.
+    """
+
+    def __init__(self, limits, shared_key=None):
+        self.buckets = {}
+        for endpoint_class, limit in limits.items():
+            if endpoint_class not in ENDPOINT_CLASSES:
+                raise Exception("Unknown endpoint class " + endpoint_class)
+            rate, burst = limit if isinstance(limit, (tuple, list)) else (limit, None)
+            state_file = None
+            if shared_key is not None:
+                digest = hashlib.sha256(shared_key.encode()).hexdigest()[:16]
+                state_file = os.path.join(tempfile.gettempdir(),
+                                          'pw-ratelimit-%d-%s-%s' % (os.getuid(), digest, endpoint_class))
+            self.buckets[endpoint_class] = TokenBucket(rate, burst, state_file)
+
+    @classmethod
+    def from_string(cls, spec, shared_key=None):
+        """
+          Parse limits like "list=10,mutate=2:5,vault=1", where the number
+          after the colon is the burst size.
+        """
+        limits = {}
+        for item in spec.split(','):
+            if not item.strip():
+                continue
+            endpoint_class, limit = item.split('=')
+            rate, _, burst = limit.partition(':')
+            limits[endpoint_class.strip()] = (float(rate), float(burst) if burst else None)
+        return cls(limits, shared_key)
+
+    def acquire(self, endpoint_class):
+        bucket = self.buckets.get(endpoint_class)
+        if bucket is not None:
+            bucket.acquire()
+
+
+def endpoint_class(method, url):
+    if '/vault/' in url:
+        return 'vault'
+    if method == 'GET' and not url.endswith(('/start', '/stop')):
+        return 'list'
+    return 'mutate'
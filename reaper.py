@@ -0,0 +1,154 @@
+import json
+import os
+import tempfile
+import time
+
+from remote import run_on_hosts
+from teardown import QUEUE_COMMAND, controller_ip, stop_clusters
+from waiter import v2_ready, v3_ready
+
+# the queued and running job ids, a marker, then allocated/idle/other/total cpus
+USAGE_COMMAND = QUEUE_COMMAND + ' && echo -- && sinfo -h -o %C'
+
+
+def default_history_path():
+    if os.environ.get('PW_IDLE_HISTORY'):
+        return os.environ['PW_IDLE_HISTORY']
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pw', 'idle.json')
+
+
+def cluster_key(ref):
+    return ref if isinstance(ref, str) else '/'.join(ref)
+
+
+def parse_usage(stdout):
+    """
+      The job count and cpu allocation from the output of USAGE_COMMAND, or
+      None when it is not complete.
+    """
+    lines = stdout.split()
+    if '--' not in lines:
+        return None
+    marker = lines.index('--')
+    try:
+        allocated, idle, other, total = (int(x) for x in lines[marker + 1].split('/'))
+    except (IndexError, ValueError):
+        return None
+    return {'jobs': marker, 'allocated_cpus': allocated, 'total_cpus': total}
+
+
+def is_idle(usage):
+    return usage is not None and usage['jobs'] == 0 and usage['allocated_cpus'] == 0
+
+
+def find_running(client, v2=True, v3=True):
+    """
+      The clusters that are up with a controller to ssh to, as a dict of
+      ref -> cluster record, resource name refs for v2 and (namespace,
+      name) for v3.
+    """
+    running = {}
+    if v2:
+        for cluster in client.get_resources(fresh=True):
+            if v2_ready(cluster):
+                running[cluster['name']] = cluster
+    if v3:
+        for cluster in client.get_v3_clusters(fresh=True):
+            if v3_ready(cluster) and cluster.get('controllerIp'):
+                running[(cluster['namespace'], cluster['name'])] = cluster
+    return running
+
+
+def scan(clusters, user, max_workers=64, timeout=20, pool=None):
+    """
+      Check the job queue and cpu allocation of every controller at once,
+      with at most max_workers ssh sessions and timeout seconds per host.
+      Returns ref -> usage, None for a controller that did not answer.
+    """
+    results = run_on_hosts({ref: controller_ip(cluster) for ref, cluster in clusters.items()},
+                           USAGE_COMMAND, user, max_workers, timeout, pool)
+    return {ref: parse_usage(result.stdout) if result.ok else None for ref, result in results.items()}
+
+
+class IdleHistory():
+    """
+      Since when each running cluster has been idle and its last few
+      checks, kept in a JSON file between runs.  A busy check resets the
+      idle time, a controller that did not answer leaves it as it was, and
+      clusters that are no longer running are dropped.
+    """
+
+    def __init__(self, path=None, keep=12):
+        self.path = path if path is not None else default_history_path()
+        self.keep = keep
+        self.entries = {}
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def record(self, key, usage, now=None):
+        now = now if now is not None else time.time()
+        entry = self.entries.setdefault(key, {'idle_since': None, 'checks': []})
+        sample = [now, usage['jobs'], usage['allocated_cpus']] if usage is not None else [now, None, None]
+        entry['checks'] = (entry['checks'] + [sample])[-self.keep:]
+        if usage is None:
+            return
+        if not is_idle(usage):
+            entry['idle_since'] = None
+        elif entry['idle_since'] is None:
+            entry['idle_since'] = now
+
+    def idle_for(self, key, now=None):
+        entry = self.entries.get(key)
+        if not entry or entry['idle_since'] is None:
+            return 0.0
+        return (now if now is not None else time.time()) - entry['idle_since']
+
+    def retain(self, keys):
+        keys = set(keys)
+        self.entries = {key: entry for key, entry in self.entries.items() if key in keys}
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix='.idle.', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+
+def reap(client, user, history, idle_after, v2=True, v3=True, dry_run=False, wait=True, timeout=None,
+         max_workers=64, ssh_timeout=20, pool=None, on_change=None):
+    """
+      One reaper cycle: find the running clusters, check them all over ssh,
+      record the checks in history and stop the clusters that have been
+      idle for idle_after seconds or more.  Right before the stop squeue
+      runs once more, so a cluster that got a job in between is left
+      running, see teardown.stop_clusters.
+
+      Returns (usage, idle, stopped): ref -> usage of every running
+      cluster, ref -> seconds idle, and ref -> StopResult of the clusters
+      it tried to stop, empty with dry_run.
+    """
+    running = find_running(client, v2, v3)
+    usage = scan(running, user, max_workers, ssh_timeout, pool)
+    now = time.time()
+    for ref, checked in usage.items():
+        history.record(cluster_key(ref), checked, now)
+    history.retain(cluster_key(ref) for ref in running)
+    history.save()
+    idle = {ref: history.idle_for(cluster_key(ref), now) for ref in running}
+    expired = {ref: running[ref] for ref in running if is_idle(usage[ref]) and idle[ref] >= idle_after}
+    if dry_run or not expired:
+        return usage, idle, {}
+    stopped = stop_clusters(client, expired, user, drain_timeout=0, timeout=timeout, wait=wait,
+                            max_workers=max_workers, ssh_timeout=ssh_timeout, pool=pool, on_change=on_change)
+    return usage, idle, stopped
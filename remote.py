@@ -0,0 +1,232 @@
+import hashlib
+import os
+import stat
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# non-interactive so that a host asking for a password fails instead of hanging the fan-out
+SSH_OPTIONS = [
+    '-o', 'StrictHostKeyChecking=no',
+    '-o', 'UserKnownHostsFile=/dev/null',
+    '-o', 'BatchMode=yes',
+    '-o', 'LogLevel=ERROR',
+]
+
+
+class RemoteResult():
+
+    def __init__(self, name, host, command, exit_code, stdout, stderr, duration, args=None):
+        self.name = name
+        self.host = host
+        self.command = command
+        self.args = args
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+
+    @property
+    def ok(self):
+        return self.exit_code == 0
+
+    @property
+    def timed_out(self):
+        return self.exit_code is None
+
+    def __repr__(self):
+        return 'RemoteResult(name=%r, host=%r, exit_code=%r, duration=%.2f)' % (
+            self.name, self.host, self.exit_code, self.duration)
+
+
+def ssh_command(user, host, command, connect_timeout=10, options=()):
+    return ['ssh'] + SSH_OPTIONS + list(options) + ['-o', 'ConnectTimeout=%d' % connect_timeout,
+                                                    '%s@%s' % (user, host), command]
+
+
+def run_remote(host, command, user, timeout=60, name=None, options=()):
+    """
+      Run command on host over ssh and return a RemoteResult.  Never raises
+      for remote failures, a timeout is reported with exit_code None.
+    """
+    args = ssh_command(user, host, command, min(10, max(1, int(timeout))), options)
+    start = time.monotonic()
+    try:
+        # parallel ssh processes must not compete for the caller's stdin
+        proc = subprocess.run(args, stdin=subprocess.DEVNULL, capture_output=True, timeout=timeout)
+        exit_code, stdout, stderr = proc.returncode, proc.stdout, proc.stderr
+    except subprocess.TimeoutExpired as e:
+        exit_code = None
+        stdout = e.stdout or b''
+        stderr = (e.stderr or b'') + b'timed out after %ds' % timeout
+    except OSError as e:
+        exit_code, stdout, stderr = 255, b'', str(e).encode()
+    return RemoteResult(name if name is not None else host, host, command, exit_code,
+                        stdout.decode(errors='replace'), stderr.decode(errors='replace'),
+                        time.monotonic() - start, args)
+
+
+def run_on_hosts(hosts, command, user, max_workers=16, timeout=60, pool=None):
+    """
+      Run the same command on many hosts at once.  hosts is a dict of
+      name -> ip (or a list of ips) and the results come back as a dict of
+      name -> RemoteResult in the same order.  Pass an SSHPool to reuse its
+      multiplexed connections.
+    """
+    if not isinstance(hosts, dict):
+        hosts = {host: host for host in hosts}
+    if not hosts:
+        return {}
+    run = pool.run if pool is not None else run_remote
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(hosts)))) as executor:
+        futures = {name: executor.submit(run, host, command, user, timeout, name)
+                   for name, host in hosts.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+class SSHPool():
+    """
+      Persistent ssh connections keyed by (user, controller ip), built on
+      OpenSSH connection multiplexing.  The first command to a host starts a
+      background master connection and every later command opens a channel
+      over it, so only the first one pays for the key exchange.
+
+      Masters idle for longer than idle_timeout are closed, by the pool and by
+      ssh itself through ControlPersist, so connections do not outlive a
+      crashed script by more than that.  A master that died is reconnected
+      on the next command.
+
+      The control sockets live in $XDG_RUNTIME_DIR/pw-ssh-<uid>, or under
+      the temp directory without one, and the pool refuses a control_dir
+      that is not ours or is open to other users.
+    """
+
+    def __init__(self, control_dir=None, idle_timeout=300, connect_timeout=10):
+        if control_dir is None:
+            base = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+            control_dir = os.path.join(base, 'pw-ssh-%d' % os.getuid())
+        os.makedirs(control_dir, mode=0o700, exist_ok=True)
+        # the path is predictable, another user could have created it first and own the sockets
+        st = os.lstat(control_dir)
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+            raise PermissionError('%s must be a directory owned by this user with mode 0700' % control_dir)
+        self.control_dir = control_dir
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.last_used = {}
+        self.lock = threading.Lock()
+        self.host_locks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.last_used)
+
+    def _touch(self, key):
+        # last_used is shared by every worker thread, only use it under self.lock
+        with self.lock:
+            self.last_used[key] = time.monotonic()
+
+    def _forget(self, key):
+        with self.lock:
+            self.last_used.pop(key, None)
+
+    def control_path(self, user, host):
+        # unix socket paths are limited to ~100 bytes, so hash the key
+        digest = hashlib.sha1(('%s@%s' % (user, host)).encode()).hexdigest()[:16]
+        return os.path.join(self.control_dir, digest)
+
+    def _options(self, user, host):
+        return ['-o', 'ControlPath=' + self.control_path(user, host)]
+
+    def _host_lock(self, key):
+        with self.lock:
+            return self.host_locks.setdefault(key, threading.Lock())
+
+    def _control(self, user, host, operation):
+        args = ['ssh'] + self._options(user, host) + ['-O', operation, '%s@%s' % (user, host)]
+        return subprocess.run(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL).returncode == 0
+
+    def is_connected(self, user, host):
+        return self._control(user, host, 'check')
+
+    def connect(self, user, host, timeout=None):
+        """
+          Make sure a master connection to host is up, starting one if needed
+          and giving up after timeout seconds.
+        """
+        key = (user, host)
+        with self._host_lock(key):
+            if not self.is_connected(user, host):
+                args = ssh_command(user, host, '', self.connect_timeout,
+                                   self._options(user, host) +
+                                   ['-o', 'ControlMaster=yes',
+                                    '-o', 'ControlPersist=%d' % self.idle_timeout,
+                                    '-o', 'ServerAliveInterval=30', '-N', '-f'])
+                # -f backgrounds the master once it is authenticated, the
+                # streams must not be pipes or the master would hold them open
+                limit = self.connect_timeout + 5 if timeout is None else min(self.connect_timeout + 5, timeout)
+                try:
+                    proc = subprocess.run(args[:-1], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                          stderr=subprocess.DEVNULL, timeout=limit)
+                except subprocess.TimeoutExpired:
+                    return False
+                if proc.returncode != 0:
+                    return False
+            self._touch(key)
+            return True
+
+    def run(self, host, command, user, timeout=60, name=None):
+        # timeout covers the whole call, connecting and any second attempt included
+        start = time.monotonic()
+        self.evict_idle()
+
+        def remaining():
+            return timeout - (time.monotonic() - start)
+
+        def out_of_time():
+            return RemoteResult(name if name is not None else host, host, command, None, '',
+                                'timed out after %ds' % timeout, time.monotonic() - start)
+
+        if not self.connect(user, host, timeout):
+            # fall back to a plain connection with what is left of the budget
+            if remaining() < 1:
+                return out_of_time()
+            return run_remote(host, command, user, remaining(), name)
+        options = self._options(user, host) + ['-o', 'ControlMaster=no']
+        result = run_remote(host, command, user, max(1, remaining()), name, options)
+        if result.exit_code == 255 and not self.is_connected(user, host):
+            # the master went away under us, reconnect and try once more
+            self._forget((user, host))
+            if remaining() >= 1 and self.connect(user, host, remaining()) and remaining() >= 1:
+                result = run_remote(host, command, user, remaining(), name, options)
+        self._touch((user, host))
+        return result
+
+    def run_on_hosts(self, hosts, command, user, max_workers=16, timeout=60):
+        return run_on_hosts(hosts, command, user, max_workers, timeout, pool=self)
+
+    def disconnect(self, user, host):
+        self._forget((user, host))
+        self._control(user, host, 'exit')
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self.lock:
+            idle = [key for key, used in self.last_used.items() if now - used > self.idle_timeout]
+        for user, host in idle:
+            self.disconnect(user, host)
+
+    def close(self):
+        with self.lock:
+            keys = list(self.last_used)
+        for user, host in keys:
+            self.disconnect(user, host)
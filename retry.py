@@ -0,0 +1,159 @@
+import email.utils
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+import requests
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    pass
+
+
+class RetryPolicy():
+    """
+      When and how long to wait before retrying a gateway call.  Idempotent
+      calls are retried on the statuses below and on connection errors,
+      other calls only when the gateway says the request was not processed
+      (429) or the connection was never made.  Waits honour Retry-After and
+      otherwise use exponential backoff with full jitter.
+    """
+
+    def __init__(self, attempts=5, backoff=0.5, max_backoff=30.0,
+                 statuses=(429, 502, 503, 504), max_retry_after=120.0):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = statuses
+        self.max_retry_after = max_retry_after
+
+    def should_retry(self, attempt, idempotent, status=None, error=None):
+        if attempt + 1 >= self.attempts:
+            return False
+        if error is not None:
+            return idempotent or isinstance(error, requests.exceptions.ConnectTimeout)
+        if idempotent:
+            return status in self.statuses
+        return status == 429
+
+    def delay(self, attempt, response=None):
+        retry_after = retry_after_seconds(response)
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+def retry_after_seconds(response):
+    # Retry-After is either a number of seconds or an HTTP date
+    if response is None:
+        return None
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker():
+    """
+      Stops calls to a gateway that keeps failing.  After failure_threshold
+      consecutive failures the circuit opens for reset_timeout seconds
+      (doubling up to max_reset_timeout while failures continue), and a
+      Retry-After from the gateway opens it for that long.  Once the time is
+      up calls go through again, a success closes the circuit and another
+      failure opens it again for longer.
+
+      With a state_file the time the circuit is open until is shared, so
+      every script using the same gateway backs off together.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=10.0, max_reset_timeout=120.0, state_file=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state_file = state_file
+        self.failures = 0
+        self.opened = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+
+    def _shared_open_until(self):
+        if self.state_file is None:
+            return 0.0
+        try:
+            with open(self.state_file) as f:
+                return float(json.load(f).get('open_until', 0))
+        except (OSError, ValueError):
+            return 0.0
+
+    def _open(self, seconds):
+        # open_until is wall clock time so other processes can read it
+        until = time.time() + seconds
+        if until <= self.open_until:
+            return
+        self.open_until = until
+        if self.state_file is not None:
+            tmp = '%s.%d.tmp' % (self.state_file, os.getpid())
+            try:
+                with open(tmp, 'w') as f:
+                    json.dump({'open_until': until}, f)
+                os.replace(tmp, self.state_file)
+            except OSError:
+                pass
+
+    def remaining(self):
+        return max(self.open_until, self._shared_open_until()) - time.time()
+
+    def wait(self, max_wait):
+        """
+          Sleep while the circuit is open, or raise CircuitOpenError if it
+          stays open longer than max_wait seconds.
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            return
+        if remaining > max_wait:
+            raise CircuitOpenError("gateway circuit is open for another %.0fs" % remaining)
+        time.sleep(remaining + random.uniform(0, min(1.0, remaining)))
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = 0
+
+    def record_failure(self, retry_after=None):
+        with self.lock:
+            self.failures += 1
+            if retry_after:
+                self._open(retry_after)
+            if self.failures >= self.failure_threshold:
+                self._open(min(self.max_reset_timeout, self.reset_timeout * 2 ** self.opened))
+                self.opened += 1
+
+
+breakers = {}
+breakers_lock = threading.Lock()
+
+
+def shared_breaker(url, **kwargs):
+    """
+      Return the circuit breaker for a gateway url, shared by every Client in
+      this process and, through a state file in the temp directory, by every
+      process of this user.
+    """
+    with breakers_lock:
+        if url not in breakers:
+            digest = hashlib.sha1(url.encode()).hexdigest()[:16]
+            state_file = os.path.join(tempfile.gettempdir(), 'pw-breaker-%d-%s.json' % (os.getuid(), digest))
+            breakers[url] = CircuitBreaker(state_file=state_file, **kwargs)
+        return breakers[url]
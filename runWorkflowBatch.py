@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+"""
+  This script will start a workflow once for every input set in a JSONL or CSV
+  file, e.g. the scenarios of a parameter sweep.
+
+  Each line of a JSONL file is a JSON object of workflow inputs.  The header
+  of a CSV file names the inputs, and a column such as "resource_label.id"
+  sets a nested input.  An optional "_id" field or column names the item,
+  otherwise its line number is used.  The inputs of every item are merged
+  over the resource_label of the cluster to run in, or over the
+  pwrl_host.resource of a v3 cluster given with --v3 [namespace/]name.
+
+  Critical files that must exist:
+
+    $HOME/.ssh/pw_api.key - this file must contain the API key in the first and only
+                            line.  Treat this file as any secure file and place in
+                            .ssh directory.  Change permissions to mode 600.
+
+  Files updated:
+    <input file>.results.jsonl - the job id or error of every submission.  Run
+                   the script again with the same input file to submit what
+                   failed or was never submitted, items already submitted are
+                   skipped.  Items interrupted while being submitted are only
+                   submitted again when PW_RESUBMIT_PENDING=1.
+
+  Submissions are throttled by PW_MAX_PARALLEL and PW_RATE_LIMIT
+  (e.g. PW_RATE_LIMIT="mutate=2:5" for two workflow starts a second).
+
+  Same as: python3 pw.py batch <arguments>, see pw.py.
+"""
+
+import sys
+from pw import main
+
+sys.exit(main(['batch'] + sys.argv[1:]))
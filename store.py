@@ -0,0 +1,89 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+def default_store_path():
+    if os.environ.get('PW_METADATA_STORE'):
+        return os.environ['PW_METADATA_STORE']
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pw', 'metadata.sqlite')
+
+
+def account_fingerprint(key):
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+class MetadataStore():
+    """
+      List responses (identity, resources, v3 clusters, storages, workflows)
+      kept in a SQLite file shared by every script of the user, keyed by
+      platform host and a fingerprint of the API key.  The raw response body
+      is stored with the time it was fetched.
+
+      The client answers from the store and refreshes entries older than
+      max_age in the background (stale-while-revalidate).  Entries older
+      than max_stale are not served without a refetch, and callers that
+      are about to change state pass fresh=<seconds> to set their own
+      limit, see Client._lookup.  A write drops the entries of the
+      collection it changes for every process.  Any SQLite error counts as
+      a miss, the store never stops a call from reaching the gateway.
+    """
+
+    def __init__(self, path=None, max_age=30.0, max_stale=86400.0):
+        self.path = path if path is not None else default_store_path()
+        self.max_age = max_age
+        self.max_stale = max_stale
+        self.lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if not os.path.exists(self.path):
+            os.close(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600))
+        self.db = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        try:
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'host TEXT, account TEXT, url TEXT, collection TEXT, fetched REAL, body BLOB, '
+                'PRIMARY KEY (host, account, url))')
+        except sqlite3.Error:
+            pass
+
+    def get(self, host, account, url):
+        """
+          Return (fetched, body) or None.
+        """
+        try:
+            with self.lock:
+                row = self.db.execute('SELECT fetched, body FROM entries WHERE host=? AND account=? AND url=?',
+                                      (host, account, url)).fetchone()
+        except sqlite3.Error:
+            return None
+        return (row[0], bytes(row[1])) if row else None
+
+    def set(self, host, account, url, collection, body, fetched=None):
+        try:
+            with self.lock:
+                self.db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                                (host, account, url, collection,
+                                 fetched if fetched is not None else time.time(), body))
+        except sqlite3.Error:
+            pass
+
+    def invalidate(self, host, account, collection=None):
+        # after a write the next read must go to the gateway, so the entries are dropped
+        try:
+            with self.lock:
+                if collection is None:
+                    self.db.execute('DELETE FROM entries WHERE host=? AND account=?', (host, account))
+                else:
+                    self.db.execute('DELETE FROM entries WHERE host=? AND account=? AND collection=?',
+                                    (host, account, collection))
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,162 @@
+import csv
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# statuses recorded in the results file
+PENDING = 'pending'
+SUBMITTED = 'submitted'
+FAILED = 'failed'
+
+
+def _set_path(inputs, column, value):
+    # a CSV column "a.b" sets inputs['a']['b']
+    keys = column.split('.')
+    for key in keys[:-1]:
+        inputs = inputs.setdefault(key, {})
+    inputs[keys[-1]] = value
+
+
+def read_inputs(path):
+    """
+      Yield (item id, inputs) for every input set in a JSONL or CSV file.
+      The id is the "_id" field or column when there is one and otherwise
+      the line number, so keep the file append-only between restarts.
+    """
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            for number, row in enumerate(csv.DictReader(f), 2):
+                inputs = {}
+                for column, value in row.items():
+                    if column is not None and value is not None and value != '':
+                        _set_path(inputs, column, value)
+                yield str(inputs.pop('_id', number)), inputs
+        else:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                inputs = json.loads(line)
+                yield str(inputs.pop('_id', number)), inputs
+
+
+def merge_inputs(base, inputs):
+    merged = dict(base)
+    for key, value in inputs.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            value = merge_inputs(merged[key], value)
+        merged[key] = value
+    return merged
+
+
+def job_id(response):
+    for key in ('jobId', 'job_id', 'jid', 'id'):
+        if isinstance(response, dict) and response.get(key):
+            return response[key]
+    return None
+
+
+class SweepResults():
+    """
+      Append-only JSONL log of a sweep, one record per state change of an
+      item.  The last record of an item is its state, so a sweep restarted
+      with the same file skips what was already submitted.
+
+      A record is written as pending before the workflow is started, so an
+      item whose last record is pending was interrupted mid-submission and
+      may or may not be running.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+        self.lock = threading.Lock()
+        try:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # a line cut short by a crash
+                        continue
+                    self.state[record['id']] = record
+        except FileNotFoundError:
+            pass
+
+    def status(self, item_id):
+        record = self.state.get(item_id)
+        return record['status'] if record else None
+
+    def record(self, item_id, status, **fields):
+        record = dict(id=item_id, status=status, time=time.time(), **fields)
+        line = json.dumps(record, default=str) + '\n'
+        with self.lock:
+            self.state[item_id] = record
+            with open(self.path, 'a') as f:
+                f.write(line)
+        return record
+
+
+def run_sweep(client, workflow, items, results, base=None, max_workers=8,
+              resubmit_pending=False, max_failures=None, on_result=None):
+    """
+      Start workflow once per (item id, inputs) in items with at most
+      max_workers submissions in flight, recording every outcome in the
+      SweepResults.  Items already submitted are skipped, failed ones are
+      tried again and interrupted (pending) ones only with resubmit_pending.
+
+      The pace comes from the client: its rate limiter ('mutate' class),
+      429 handling and circuit breaker apply to every submission.  After
+      max_failures failures in a row no more items are started, so a broken
+      workflow or gateway does not burn through the whole file.
+
+      Returns a dict of status -> count for this run, with skipped items
+      counted as 'skipped'.
+    """
+    base = base or {}
+    counts = {SUBMITTED: 0, FAILED: 0, 'skipped': 0}
+    lock = threading.Lock()
+    failures = [0]
+
+    def submit(item):
+        item_id, inputs = item
+        if max_failures is not None and failures[0] >= max_failures:
+            return None
+        results.record(item_id, PENDING)
+        try:
+            response = client.run_workflow(workflow, merge_inputs(base, inputs))
+        except Exception as e:
+            record = results.record(item_id, FAILED, error=str(e))
+        else:
+            record = results.record(item_id, SUBMITTED, job_id=job_id(response),
+                                    message=response.get('message') if isinstance(response, dict) else None)
+        with lock:
+            counts[record['status']] += 1
+            failures[0] = failures[0] + 1 if record['status'] == FAILED else 0
+        if on_result is not None:
+            on_result(record)
+        return record
+
+    def todo():
+        for item_id, inputs in items:
+            status = results.status(item_id)
+            if status == SUBMITTED or (status == PENDING and not resubmit_pending):
+                counts['skipped'] += 1
+                continue
+            yield item_id, inputs
+
+    # submit lazily so a file of thousands of items is never all in memory
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = set()
+        for item in todo():
+            if max_failures is not None and failures[0] >= max_failures:
+                break
+            if len(pending) >= max_workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(pool.submit(submit, item))
+        for future in pending:
+            future.result()
+    return counts
@@ -0,0 +1,67 @@
+import os
+
+
+class LogTail():
+    """
+      Follows one remote platform file and appends its new bytes to a local
+      file.  The read position is a byte offset, so every poll transfers only
+      what was added since the last one.  By default it resumes from the size
+      of the local file, so a restarted script carries on where it stopped.
+
+      When the remote file becomes shorter than the offset it was truncated
+      or rotated: the local copy is moved aside to <local_path>.1 and the
+      file is read again from the start.
+    """
+
+    def __init__(self, remote_path, local_path=None, offset=None, chunk_size=64 * 1024):
+        self.remote_path = remote_path
+        self.local_path = local_path if local_path is not None else os.path.basename(remote_path)
+        if offset is None:
+            offset = os.path.getsize(self.local_path) if os.path.exists(self.local_path) else 0
+        self.offset = offset
+        self.chunk_size = chunk_size
+        self.rotations = 0
+
+    def __repr__(self):
+        return 'LogTail(%r, offset=%d)' % (self.remote_path, self.offset)
+
+    @classmethod
+    def for_job(cls, jid, file, local_path=None, offset=None):
+        return cls("/pw/jobs/{}/{}".format(jid, file), local_path, offset)
+
+    def _rotate(self):
+        if os.path.exists(self.local_path):
+            os.replace(self.local_path, self.local_path + '.1')
+        self.offset = 0
+        self.rotations += 1
+
+    def poll(self, client):
+        """
+          Append the bytes added to the remote file since the last poll and
+          return how many were written.
+        """
+        req, start, total = client.open_file(self.remote_path, self.offset)
+        if total is not None and total < self.offset:
+            if req is not None:
+                req.close()
+            self._rotate()
+            req, start, total = client.open_file(self.remote_path, 0)
+        if req is None:
+            return 0
+        # a server that ignores the range sends the whole file, skip what we have
+        skip = self.offset - start
+        written = 0
+        try:
+            with open(self.local_path, 'ab') as f:
+                for chunk in req.iter_content(chunk_size=self.chunk_size):
+                    if skip:
+                        dropped = min(skip, len(chunk))
+                        chunk = chunk[dropped:]
+                        skip -= dropped
+                    if chunk:
+                        f.write(chunk)
+                        written += len(chunk)
+        finally:
+            req.close()
+        self.offset += written
+        return written
@@ -0,0 +1,125 @@
+import time
+
+from remote import run_on_hosts
+from waiter import ClusterWaiter, ClusterWaitTimeout
+
+# one line per job that is queued or still running, without a header
+QUEUE_COMMAND = 'squeue -h -t PENDING,CONFIGURING,RUNNING,COMPLETING,SUSPENDED -o %i'
+
+
+def controller_ip(cluster):
+    if 'controllerIp' in cluster:
+        return cluster.get('controllerIp')
+    return (cluster.get('state') or {}).get('masterNode')
+
+
+def queued_jobs(hosts, user, max_workers=16, timeout=60, pool=None):
+    """
+      Count the queued and running Slurm jobs on many controllers at once.
+      hosts is a dict of name -> controller ip and the result a dict of
+      name -> job count, None where squeue could not be run.
+    """
+    results = run_on_hosts(hosts, QUEUE_COMMAND, user, max_workers, timeout, pool)
+    return {name: len(result.stdout.split()) if result.ok else None for name, result in results.items()}
+
+
+def drain(clusters, user, timeout=0, interval=30, max_workers=16, ssh_timeout=60, pool=None, on_check=None):
+    """
+      Wait until the clusters have no queued or running jobs.  clusters is
+      a dict of ref -> cluster record.  Busy and unreachable controllers
+      are checked again every interval seconds until timeout has passed,
+      so timeout=0 checks once.  Returns ref -> job count of the last
+      check, None for a controller without an IP or that did not answer.
+    """
+    hosts = {ref: controller_ip(cluster) for ref, cluster in clusters.items()}
+    jobs = {ref: None for ref, ip in hosts.items() if not ip}
+    pending = {ref: ip for ref, ip in hosts.items() if ip}
+    deadline = time.monotonic() + timeout
+    while pending:
+        counts = queued_jobs(pending, user, max_workers, ssh_timeout, pool)
+        jobs.update(counts)
+        if on_check is not None:
+            on_check(counts)
+        pending = {ref: pending[ref] for ref, count in counts.items() if count != 0}
+        if not pending or time.monotonic() + interval > deadline:
+            break
+        time.sleep(interval)
+    return {ref: jobs[ref] for ref in clusters}
+
+
+class StopResult():
+    """
+      What happened to one cluster: state is 'off' once it was seen off,
+      'sent' when the stop was not waited for, 'busy' or 'unreachable' when
+      the drain left it running, 'failed' or 'timeout' otherwise.  latency
+      is the time from sending the stops to seeing the cluster off.
+    """
+
+    def __init__(self, ref):
+        self.ref = ref
+        self.state = 'pending'
+        self.jobs = None
+        self.response = None
+        self.latency = None
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.state in ('off', 'sent')
+
+    def __repr__(self):
+        return 'StopResult(ref=%r, state=%r, latency=%r)' % (self.ref, self.state, self.latency)
+
+
+def stop_clusters(client, clusters, user=None, drain_timeout=None, drain_interval=30, timeout=None, wait=True,
+                  max_workers=8, ssh_timeout=60, pool=None, on_check=None, on_change=None):
+    """
+      Stop many v2 and v3 clusters at once and wait until every one of them
+      reports off.  clusters is a dict of ref -> cluster record, with the
+      resource name as ref for v2 clusters and (namespace, name) for v3.
+
+      With a drain_timeout (0 checks once) squeue runs on every controller
+      first, as user, and clusters that still have jobs after drain_timeout
+      seconds, or whose controller cannot be reached, are left running.
+      timeout is the deadline for the whole fleet to reach off.  Returns a
+      dict of ref -> StopResult in the order of clusters.
+    """
+    results = {ref: StopResult(ref) for ref in clusters}
+    to_stop = list(clusters)
+    if drain_timeout is not None:
+        jobs = drain(clusters, user, drain_timeout, drain_interval, max_workers, ssh_timeout, pool, on_check)
+        for ref, count in jobs.items():
+            results[ref].jobs = count
+            if count != 0:
+                results[ref].state = 'unreachable' if count is None else 'busy'
+        to_stop = [ref for ref in to_stop if jobs[ref] == 0]
+
+    # v2 clusters are stopped by resource id but watched by name
+    targets = {ref if isinstance(ref, tuple) else clusters[ref]['id']: ref for ref in to_stop}
+    started = time.monotonic()
+    responses, errors = client.stop_many(list(targets), max_workers)
+    for target, ref in targets.items():
+        if target in errors:
+            results[ref].state = 'failed'
+            results[ref].error = errors[target]
+        else:
+            results[ref].response = responses[target]
+            results[ref].state = 'sent'
+    if not wait:
+        return results
+
+    def settled(ref, cluster, error):
+        result = results[ref]
+        result.latency = time.monotonic() - started
+        if error is None:
+            result.state = 'off'
+        else:
+            result.state = 'timeout' if isinstance(error, ClusterWaitTimeout) else 'failed'
+            result.error = error
+
+    waiter = ClusterWaiter(client, timeout=timeout, on_change=on_change, until='off')
+    for ref, result in results.items():
+        if result.state == 'sent':
+            waiter.add(ref, callback=settled)
+    waiter.run()
+    return results
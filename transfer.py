@@ -0,0 +1,198 @@
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def sha256_digest(data):
+    return 'sha-256=' + base64.b64encode(hashlib.sha256(data).digest()).decode()
+
+
+class UploadState():
+    """
+      The chunks of an upload the server has confirmed, kept in a JSON file
+      next to the local file so an interrupted upload can resume.  The state
+      only applies to the same file (size and mtime), destination and chunk
+      layout, anything else starts the upload over.
+    """
+
+    def __init__(self, path, identity):
+        self.path = path
+        self.identity = identity
+        self.done = set()
+        self.lock = threading.Lock()
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get('identity') == identity:
+                self.done = set(saved.get('done', []))
+        except (OSError, ValueError):
+            pass
+
+    def confirm(self, index):
+        with self.lock:
+            self.done.add(index)
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'identity': self.identity, 'done': sorted(self.done)}, f)
+            os.replace(tmp, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class UploadNotSupported(Exception):
+    pass
+
+
+# statuses of a server that does not take ranged PUTs on the file path
+UNSUPPORTED_STATUSES = (400, 405, 501)
+
+
+def upload_file(client, filename, remote_path, chunk_size=8 * 1024 * 1024, max_workers=4,
+                compress=False, state_file=None):
+    """
+      Upload filename to remote_path in chunks sent in parallel.  Each chunk
+      is read from disk when it is sent, so at most max_workers chunks are in
+      memory, and is sent as a ranged PUT with a Digest header carrying its
+      SHA-256.  Confirmed chunks are recorded in state_file
+      (<filename>.upload.json by default) and skipped on the next attempt.
+      With compress each chunk is gzip encoded on the fly.
+
+      This needs a server that accepts partial PUTs on the file path, which
+      plain HTTP does not (RFC 7231 4.3.4) and the platform does not
+      document.  The server must write the bytes of each PUT at the offset
+      of its Content-Range, check the Digest of the body as sent and
+      answer 2xx only once the chunk is stored.  There is no separate
+      finalize call, the upload is complete once every byte up to the
+      total size in Content-Range has been written.  A 400, 405 or 501
+      answer raises UploadNotSupported.
+    """
+    size = os.path.getsize(filename)
+    stat = os.stat(filename)
+    chunks = max(1, -(-size // chunk_size))
+    state = UploadState(
+        state_file if state_file is not None else filename + '.upload.json',
+        [remote_path, size, int(stat.st_mtime), chunk_size, bool(compress)]
+    )
+    resumed = len(state.done)
+    url = client.file_url(remote_path)
+
+    def send(index):
+        offset = index * chunk_size
+        with open(filename, 'rb') as f:
+            f.seek(offset)
+            data = f.read(chunk_size)
+        headers = {
+            'Content-Type': 'application/octet-stream',
+            'Content-Range': 'bytes %d-%d/%d' % (offset, offset + len(data) - 1, size) if data else 'bytes */0',
+        }
+        if compress:
+            data = gzip.compress(data)
+            headers['Content-Encoding'] = 'gzip'
+        headers['Digest'] = sha256_digest(data)
+        req = client._request('PUT', url, headers = headers, data = data)
+        if req.status_code in UNSUPPORTED_STATUSES:
+            raise UploadNotSupported('%s answered %d to a ranged PUT of %s, it does not take chunked uploads'
+                                     % (client.url, req.status_code, remote_path))
+        req.raise_for_status()
+        state.confirm(index)
+        return len(data)
+
+    todo = [index for index in range(chunks) if index not in state.done]
+    sent = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(todo) or 1))) as pool:
+        for n in pool.map(send, todo):
+            sent += n
+    state.remove()
+    return {
+        'status': 'success',
+        'file': remote_path,
+        'size': size,
+        'chunks': chunks,
+        'resumed_chunks': resumed,
+        'bytes_sent': sent,
+    }
+
+
+class IntegrityError(Exception):
+    pass
+
+
+def _write_response(req, f, offset, chunk_size=1024 * 1024):
+    f.seek(offset)
+    written = 0
+    try:
+        for chunk in req.iter_content(chunk_size=chunk_size):
+            f.write(chunk)
+            written += len(chunk)
+    finally:
+        req.close()
+    return written
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def download_file(client, remote_path, local_path, parallel=4, part_size=16 * 1024 * 1024,
+                  sha256=None, verify_zip=False):
+    """
+      Download remote_path to local_path without holding it in memory.  The
+      first part is requested as a byte range: if the server honours it and
+      the file is larger, the remaining parts are fetched by up to parallel
+      ranged requests into their place in the file, otherwise the whole body
+      is streamed.  The data goes to <local_path>.part, is checked against
+      the size the server reported, the expected sha256 and, with
+      verify_zip, the zip CRCs, and is only then renamed to local_path.
+    """
+    tmp = local_path + '.part'
+    try:
+        req, _, total = client.open_file(remote_path, 0, part_size - 1)
+        with open(tmp, 'wb') as f:
+            if req is None:
+                total = 0
+            elif req.status_code == 206 and total is not None and total > part_size:
+                f.truncate(total)
+                _write_response(req, f, 0)
+                f.flush()
+                offsets = range(part_size, total, part_size)
+
+                def fetch(offset):
+                    part, _, _ = client.open_file(remote_path, offset, min(total, offset + part_size) - 1)
+                    with open(tmp, 'r+b') as part_file:
+                        return _write_response(part, part_file, offset)
+
+                with ThreadPoolExecutor(max_workers=max(1, min(parallel, len(offsets)))) as pool:
+                    list(pool.map(fetch, offsets))
+            else:
+                _write_response(req, f, 0)
+        size = os.path.getsize(tmp)
+        if total is not None and size != total:
+            raise IntegrityError("%s: got %d bytes, expected %d" % (remote_path, size, total))
+        digest = _sha256_file(tmp) if sha256 is not None else None
+        if digest is not None and digest != sha256.lower():
+            raise IntegrityError("%s: sha256 mismatch" % remote_path)
+        if verify_zip and local_path.endswith('.zip'):
+            import zipfile
+            try:
+                with zipfile.ZipFile(tmp) as archive:
+                    bad = archive.testzip()
+            except zipfile.BadZipFile as e:
+                raise IntegrityError("%s: %s" % (remote_path, e))
+            if bad is not None:
+                raise IntegrityError("%s: corrupt member %s" % (remote_path, bad))
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, local_path)
+    return {'path': local_path, 'size': size, 'sha256': digest}
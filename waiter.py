@@ -0,0 +1,223 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from poller import PollScheduler, v2_near_ready, v3_near_ready
+
+# cluster states that mean the cluster will not come up
+FAILED_STATES = ('error', 'deleted', 'failed')
+
+
+class ClusterWaitError(Exception):
+
+    def __init__(self, ref, reason, cluster=None):
+        Exception.__init__(self, '%s: %s' % (ref if isinstance(ref, str) else '/'.join(ref), reason))
+        self.ref = ref
+        self.reason = reason
+        self.cluster = cluster
+
+
+class ClusterWaitTimeout(ClusterWaitError):
+    pass
+
+
+def v2_ready(cluster):
+    return cluster['status'] == 'on' and bool((cluster.get('state') or {}).get('masterNode'))
+
+
+def v3_ready(cluster):
+    return cluster['status'] == 'on' and cluster.get('currentSessionStatus') == 'running'
+
+
+def v2_off(cluster):
+    return cluster['status'] == 'off'
+
+
+def v3_off(cluster):
+    return cluster['status'] == 'off'
+
+
+def cluster_failed(cluster):
+    # an off cluster still shows how its last session ended, which says nothing about the next one
+    if cluster.get('status') in FAILED_STATES:
+        return True
+    return cluster.get('status') != 'off' and cluster.get('currentSessionStatus') in FAILED_STATES
+
+
+class ClusterWaiter():
+    """
+      Waits for any number of v2 and v3 clusters to become ready, or with
+      until='off' for them to be stopped.
+
+      v2 clusters are added by resource name and are ready once their master
+      node has an IP, v3 clusters are added as (namespace, name) and are
+      ready once their session is running.  Each tick makes at most one
+      resources list call and one v3 clusters list call, for the clusters
+      whose adaptive poll time has come up.
+
+      add() returns a Future per cluster that resolves to the cluster record
+      when it is ready (or off), or fails with ClusterWaitError when the
+      cluster goes to error or deleted, disappears, or with
+      ClusterWaitTimeout when its own timeout or the overall deadline
+      passes.  A cluster that was just started may still show how its last
+      session ended, so error and deleted only count once it has been seen
+      on or grace seconds after it was added.  Use run() to block until
+      every cluster is settled or start() to wait in a background thread and
+      act on each future as it completes.
+    """
+
+    def __init__(self, client, timeout=None, cluster_timeout=None, scheduler=None, on_change=None, until='ready',
+                 grace=60.0):
+        if until not in ('ready', 'off'):
+            raise ValueError("until must be 'ready' or 'off'")
+        self.client = client
+        self.until = until
+        self.timeout = timeout
+        self.cluster_timeout = cluster_timeout
+        self.scheduler = scheduler if scheduler is not None else PollScheduler()
+        self.on_change = on_change
+        self.futures = {}
+        self.deadlines = {}
+        self.laststate = {}
+        self.grace = grace
+        self.added = {}
+        self.seen_on = set()
+        self.deadline = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def add(self, ref, callback=None, timeout=None):
+        """
+          Track a cluster.  callback(ref, cluster, error) is called once the
+          cluster is ready (or off) or has failed.
+        """
+        with self.lock:
+            if ref in self.futures:
+                future = self.futures[ref]
+            else:
+                future = Future()
+                future.set_running_or_notify_cancel()
+                self.futures[ref] = future
+                self.added[ref] = time.monotonic()
+                timeout = timeout if timeout is not None else self.cluster_timeout
+                if timeout is not None:
+                    self.deadlines[ref] = time.monotonic() + timeout
+                self.scheduler.add(ref)
+        if callback is not None:
+            future.add_done_callback(lambda f: callback(ref, None if f.exception() else f.result(), f.exception()))
+        return future
+
+    def pending(self):
+        with self.lock:
+            return [ref for ref, future in self.futures.items() if not future.done()]
+
+    def _settle(self, ref, cluster=None, error=None):
+        self.scheduler.discard(ref)
+        self.deadlines.pop(ref, None)
+        if error is not None:
+            self.futures[ref].set_exception(error)
+        else:
+            self.futures[ref].set_result(cluster)
+
+    def _state(self, ref, cluster):
+        if isinstance(ref, tuple):
+            return (cluster['status'], cluster.get('currentSessionStatus'))
+        return (cluster['status'], cluster.get('state'))
+
+    def _done(self, ref, cluster):
+        if self.until == 'off':
+            return (v3_off if isinstance(ref, tuple) else v2_off)(cluster)
+        return (v3_ready if isinstance(ref, tuple) else v2_ready)(cluster)
+
+    def _current(self, ref):
+        # whether a failed state belongs to this start and not to the one before
+        return ref in self.seen_on or time.monotonic() - self.added[ref] >= self.grace
+
+    def _check(self, ref, cluster):
+        if cluster is None:
+            self._settle(ref, error=ClusterWaitError(ref, 'not found or deleted'))
+            return
+        state = self._state(ref, cluster)
+        changed = self.laststate.get(ref) != state
+        if cluster['status'] == 'on':
+            self.seen_on.add(ref)
+        if changed:
+            self.laststate[ref] = state
+            if self.on_change is not None:
+                self.on_change(ref, cluster)
+        if self.until == 'off':
+            # the session that just ended may be left as deleted or failed, only the status counts
+            if self._done(ref, cluster):
+                self._settle(ref, cluster)
+            elif cluster.get('status') in FAILED_STATES:
+                self._settle(ref, error=ClusterWaitError(ref, 'cluster is in state ' + str(state), cluster))
+            else:
+                self.scheduler.observe(ref, changed=changed)
+        elif cluster_failed(cluster) and self._current(ref):
+            self._settle(ref, error=ClusterWaitError(ref, 'cluster is in state ' + str(state), cluster))
+        elif self._done(ref, cluster):
+            self._settle(ref, cluster)
+        else:
+            near_ready = (v3_near_ready if isinstance(ref, tuple) else v2_near_ready)(cluster)
+            self.scheduler.observe(ref, changed=changed, near_ready=near_ready)
+
+    def _expire(self):
+        now = time.monotonic()
+        for ref in self.pending():
+            if self.deadline is not None and now >= self.deadline:
+                self._settle(ref, error=ClusterWaitTimeout(ref, 'overall deadline passed'))
+            elif ref in self.deadlines and now >= self.deadlines[ref]:
+                self._settle(ref, error=ClusterWaitTimeout(ref, 'timed out waiting for cluster'))
+
+    def poll(self):
+        """
+          Check the clusters that are due once and return how many are
+          still pending.
+        """
+        due = [ref for ref in self.scheduler.due() if ref in self.futures and not self.futures[ref].done()]
+        v2 = [ref for ref in due if not isinstance(ref, tuple)]
+        v3 = [ref for ref in due if isinstance(ref, tuple)]
+        if v2:
+            index = self.client.get_resource_index(fresh=True)
+            for ref in v2:
+                self._check(ref, index.get(ref))
+        if v3:
+            index = self.client.get_v3_cluster_index(fresh=True)
+            for ref in v3:
+                self._check(ref, index.get(ref[1], ref[0]))
+        self._expire()
+        return len(self.pending())
+
+    def run(self):
+        """
+          Poll until every cluster is ready (or off), failed or timed out and return
+          the dict of ref -> Future.
+        """
+        if self.timeout is not None and self.deadline is None:
+            self.deadline = time.monotonic() + self.timeout
+        while self.poll():
+            delay = self.scheduler.next_delay()
+            if self.deadline is not None:
+                delay = min(delay, max(0, self.deadline - time.monotonic()))
+            if self.deadlines:
+                delay = min(delay, max(0, min(self.deadlines.values()) - time.monotonic()))
+            time.sleep(delay)
+        return dict(self.futures)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run_safely, daemon=True)
+        self.thread.start()
+        return self
+
+    def _run_safely(self):
+        # a failing list call fails every pending future instead of leaving them hanging
+        try:
+            self.run()
+        except Exception as e:
+            for ref in self.pending():
+                self._settle(ref, error=ClusterWaitError(ref, 'waiter stopped: %s' % e))
+
+    def join(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+        return dict(self.futures)
@@ -0,0 +1,83 @@
+import hashlib
+import json
+
+# event kinds, in the order they are reported for one record
+CREATED = 'created'
+STATUS = 'status'
+SESSION_STATUS = 'session_status'
+CONTROLLER_IP = 'controller_ip'
+UPDATED = 'updated'
+DELETED = 'deleted'
+
+
+class ClusterEvent():
+
+    def __init__(self, kind, key, cluster, old=None, new=None):
+        self.kind = kind
+        self.key = key
+        self.cluster = cluster
+        self.old = old
+        self.new = new
+
+    @property
+    def v3(self):
+        return isinstance(self.key, tuple)
+
+    @property
+    def name(self):
+        return self.key[1] if self.v3 else self.key
+
+    def __repr__(self):
+        return 'ClusterEvent(%s, %r, %r -> %r)' % (self.kind, self.key, self.old, self.new)
+
+
+def fingerprint(record):
+    return hashlib.blake2b(json.dumps(record, sort_keys=True, default=str).encode(), digest_size=16).digest()
+
+
+def record_key(record, v3):
+    return (record.get('namespace'), record['name']) if v3 else record['name']
+
+
+def controller_ip(record):
+    if 'controllerIp' in record:
+        return record.get('controllerIp') or None
+    return (record.get('state') or {}).get('masterNode')
+
+
+def diff_records(snapshot, records, v3, include_updates=False):
+    """
+      Compare a list response with the snapshot from the previous poll and
+      return (events, new snapshot).  The snapshot maps each key to a
+      (fingerprint, record) pair so unchanged records cost one hash.
+    """
+    events = []
+    current = {}
+    for record in records:
+        key = record_key(record, v3)
+        fp = fingerprint(record)
+        current[key] = (fp, record)
+        previous = snapshot.get(key)
+        if previous is None:
+            events.append(ClusterEvent(CREATED, key, record, None, record.get('status')))
+            continue
+        if previous[0] == fp:
+            continue
+        old = previous[1]
+        found = False
+        if old.get('status') != record.get('status'):
+            events.append(ClusterEvent(STATUS, key, record, old.get('status'), record.get('status')))
+            found = True
+        if v3 and old.get('currentSessionStatus') != record.get('currentSessionStatus'):
+            events.append(ClusterEvent(SESSION_STATUS, key, record,
+                                       old.get('currentSessionStatus'), record.get('currentSessionStatus')))
+            found = True
+        if controller_ip(old) != controller_ip(record):
+            events.append(ClusterEvent(CONTROLLER_IP, key, record, controller_ip(old), controller_ip(record)))
+            found = True
+        if include_updates and not found:
+            events.append(ClusterEvent(UPDATED, key, record))
+    for key, (fp, record) in snapshot.items():
+        if key not in current:
+            events.append(ClusterEvent(DELETED, key, record, record.get('status'), None))
+    return events, current